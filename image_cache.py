@@ -0,0 +1,303 @@
+import os
+import time
+import hashlib
+import zlib
+import threading
+from collections import OrderedDict
+from PIL import Image
+from stitch_engine import probe_size, load_thumbnail, load_resized, flatten
+
+# --- AoiStitcher 磁盘缓存 ---
+# 不依赖 tkinter，可以被界面和导出引擎共用。
+
+
+class DiskLRU:
+    # 磁盘缓存的公共部分：条目以 “绝对路径 | 文件大小 | mtime | 其他参数” 的哈希命名，
+    # 原图被修改后自然失效；命中时刷新条目的 mtime，超出容量时按 mtime 从旧到新淘汰。
+    ext = ".bin"
+
+    def __init__(self, cache_dir, limit_mb):
+        self.cache_dir = cache_dir
+        self.limit_bytes = int(limit_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._total = None  # 首次写入时才扫描目录
+        self.hits = self.misses = 0  # 命中计数，性能记录用
+
+    def __getstate__(self):
+        # 导出用进程池时缓存对象要能传给子进程，锁不能 pickle
+        state = dict(self.__dict__); del state["_lock"]; return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state); self._lock = threading.Lock()
+
+    def _entry_path(self, path, *params):
+        st = os.stat(path)
+        raw = "|".join([os.path.abspath(path), str(st.st_size), str(st.st_mtime_ns)] + [str(p) for p in params])
+        return os.path.join(self.cache_dir, hashlib.sha1(raw.encode("utf-8")).hexdigest() + self.ext)
+
+    def _touch(self, entry):
+        try: os.utime(entry)
+        except OSError: pass
+
+    def _write(self, entry, write_fn):
+        # write_fn(tmp_path) 写临时文件，成功后原子改名，再按容量淘汰
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+            write_fn(tmp)
+            os.replace(tmp, entry)
+            added = os.path.getsize(entry)
+        except OSError as e:
+            print(f"Cache write error: {e}"); return
+        with self._lock:
+            if self._total is None: self._total = sum(sz for _, _, sz in self._scan())
+            else: self._total += added
+            if self._total > self.limit_bytes: self._evict()
+
+    def _scan(self):
+        out = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for e in it:
+                    if e.name.endswith(self.ext):
+                        try:
+                            st = e.stat(); out.append((st.st_mtime, e.path, st.st_size))
+                        except OSError: pass
+        except OSError: pass
+        return out
+
+    def _evict(self):
+        # 淘汰到容量的 90%，避免每写一张就扫一次目录
+        entries = sorted(self._scan())
+        self._total = sum(sz for _, _, sz in entries)
+        target = self.limit_bytes * 0.9
+        for _, p, sz in entries:
+            if self._total <= target: break
+            if self._remove(p): self._total -= sz
+
+    def _remove(self, entry):
+        try:
+            os.remove(entry); return True
+        except OSError:
+            return False
+
+
+class ThumbnailCache(DiskLRU):
+    # 预览缩略图的持久化缓存（JPEG）。
+    # 原图尺寸写在 JPEG 注释里，重复导入时连原图的文件头都不用读。
+    ext = ".jpg"
+
+    def __init__(self, cache_dir, limit_mb=512):
+        super().__init__(cache_dir, limit_mb)
+
+    @staticmethod
+    def _stored_size(img):
+        w, h = img.info["comment"].decode("ascii").split(",")
+        return int(w), int(h)
+
+    def probe_size(self, path, max_side=1600):
+        # 优先从缓存条目的注释里拿原图尺寸
+        try:
+            with Image.open(self._entry_path(path, max_side)) as img:
+                return self._stored_size(img)
+        except Exception:
+            return probe_size(path)
+
+    def load(self, path, max_side=1600):
+        entry = self._entry_path(path, max_side)
+        try:
+            img = Image.open(entry)
+            try:
+                self._stored_size(img); img.load()
+            except Exception:
+                img.close(); raise
+            self._touch(entry)
+            self.hits += 1
+            return img
+        except FileNotFoundError:
+            pass
+        except Exception:
+            # 条目损坏（写到一半断电之类），删掉重建
+            self._remove(entry)
+
+        self.misses += 1
+        img = load_thumbnail(path, max_side)
+        w, h = probe_size(path)
+        self._write(entry, lambda tmp: img.save(tmp, format="JPEG", quality=90, comment=f"{w},{h}".encode("ascii")))
+        return img
+
+
+class ResizeCache(DiskLRU):
+    # 导出用：缓存按成品宽度缩放好的整张照片（RGB 像素经 zlib 快速压缩，无损）。
+    # 以 路径 + mtime + 目标宽度 + 缩放档位 为键，调整顺序或水印后再导出只剩合成和编码。
+    # 文件格式：魔数 + 宽 + 高（各 4 字节）+ zlib(RGB 像素)。
+    ext = ".rgb"
+    MAGIC = b"AOIZ"
+
+    def __init__(self, cache_dir, limit_mb=1024):
+        super().__init__(cache_dir, limit_mb)
+        self._writable = None  # plan() 挑出的可写条目；None = 不限
+
+    def plan(self, paths, tw, heights, proof=False):
+        # 导出开始前调用：按顺序挑出放得进容量的前若干张，这次只写入这些。
+        # 整批放不下时照样全写的话，按 mtime 淘汰正好删掉下一次最先要读的条目，
+        # 每次 0 命中还白写一遍；只缓存放得下的前缀，重复导出时这一段稳定命中。
+        # 已有条目按实际大小计，没有的按未压缩大小估（偏保守）
+        mode = "proof" if proof else "lanczos"
+        budget, used, writable = self.limit_bytes * 0.9, 0, set()
+        for path, h in zip(paths, heights):
+            try:
+                entry = self._entry_path(path, tw, mode)
+            except OSError:
+                continue
+            try: size = os.path.getsize(entry)
+            except OSError: size = tw * h * 3 + 12
+            if used + size > budget: break
+            used += size; writable.add(entry)
+        self._writable = writable
+
+    def load(self, path, tw, proof=False, timings=None):
+        # timings 见 stitch_engine.load_resized；另外记下是否命中
+        mode = "proof" if proof else "lanczos"
+        entry = self._entry_path(path, tw, mode)
+        try:
+            if timings is not None: t0 = time.perf_counter()
+            with open(entry, "rb") as f:
+                head = f.read(12)
+                if head[:4] != self.MAGIC: raise ValueError("bad header")
+                size = (int.from_bytes(head[4:8], "little"), int.from_bytes(head[8:12], "little"))
+                data = zlib.decompress(f.read())
+            img = Image.frombytes("RGB", size, data)
+            self._touch(entry)
+            self.hits += 1
+            if timings is not None: timings.update(cache_read=time.perf_counter() - t0, resize_cache=True)
+            return img
+        except FileNotFoundError:
+            pass
+        except Exception:
+            self._remove(entry)
+
+        self.misses += 1
+        if timings is not None: timings["resize_cache"] = False
+        with load_resized(path, tw, proof, timings) as resized:
+            img = flatten(resized)
+        if self._writable is not None and entry not in self._writable: return img
+
+        def write(tmp):
+            with open(tmp, "wb") as f:
+                f.write(self.MAGIC + img.size[0].to_bytes(4, "little") + img.size[1].to_bytes(4, "little"))
+                f.write(zlib.compress(img.tobytes(), 1))
+        self._write(entry, write)
+        return img
+
+
+class LogoCache:
+    # 水印只按 (路径, mtime) 解码一次，再按目标宽度缓存几份缩放结果。
+    # 预览拖滑块和导出共用同一份，导出线程也会读，所以加锁。
+    def __init__(self, max_sizes=8):
+        self.max_sizes = max_sizes
+        self._lock = threading.Lock()
+        self._key = None
+        self._decoded = None
+        self._sized = OrderedDict()
+        self.hits = self.misses = 0
+
+    def decoded(self, path):
+        key = (os.path.abspath(path), os.stat(path).st_mtime_ns)
+        with self._lock:
+            if key != self._key:
+                with Image.open(path) as raw:
+                    self._decoded = raw.convert("RGBA")
+                self._key = key
+                self._sized.clear()
+            return self._decoded
+
+    def resized(self, path, lw):
+        logo = self.decoded(path)
+        lw = max(lw, 1)
+        with self._lock:
+            if lw in self._sized:
+                self._sized.move_to_end(lw)
+                self.hits += 1
+                return self._sized[lw]
+            self.misses += 1
+        lh = max(int(logo.size[1] * (lw / logo.size[0])), 1)
+        out = logo.resize((lw, lh), Image.Resampling.LANCZOS)
+        with self._lock:
+            if self._decoded is logo:
+                self._sized[lw] = out
+                while len(self._sized) > self.max_sizes: self._sized.popitem(last=False)
+        return out
+
+
+class PreviewStore:
+    # 预览图金字塔：每张图保存 2 的幂级别的缩小版（1600、800、400 ...），
+    # 取图时给出“宽度够用的最小一级”，缺的级别从已有的大级别 reduce() 现做；用过之后大级别先被淘汰。
+    # 所有级别共用一个内存预算，按 LRU 淘汰；被淘汰的图由调用方从磁盘缓存重建。
+    # 只在 Tk 主线程里使用，不加锁。
+    def __init__(self, budget_mb=256, min_width=64):
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.min_width = min_width
+        self._entries = OrderedDict()  # (path, level) -> Image
+        self._levels = {}              # path -> {level, ...}
+        self._base_width = {}          # path -> 第 0 级宽度，淘汰后也保留
+        self._bytes = 0
+        self.hits = self.misses = 0    # get() 直接命中所需级别 / 要现做或缺图
+
+    @staticmethod
+    def _cost(img):
+        return img.size[0] * img.size[1] * 4  # Pillow 的 RGB 每像素占 4 字节
+
+    def _level_for(self, path, width):
+        # 宽度仍 >= width 的最深级别
+        w, level = self._base_width[path], 0
+        while (w + 1) // 2 >= max(width, self.min_width):
+            w, level = (w + 1) // 2, level + 1
+        return level
+
+    def put(self, path, base):
+        self._base_width[path] = base.size[0]
+        self._add(path, 0, base)
+
+    def get(self, path, width):
+        if path not in self._base_width:
+            self.misses += 1; return None
+        want = self._level_for(path, width)
+        have = [k for k in self._levels.get(path, ()) if k <= want]
+        if not have:
+            self.misses += 1; return None
+        level = max(have)
+        if level == want: self.hits += 1
+        else: self.misses += 1
+        img = self._entries[(path, level)]
+        self._entries.move_to_end((path, level))
+        if level < want:
+            # 中间各级只是过渡，不存，一次 reduce 到位
+            img = img.reduce(2 ** (want - level))
+            self._add(path, want, img)
+        # 比 want 大的级别挪到 LRU 最前面先被淘汰，预算留给视口里真正用到的小级别
+        for k in self._levels[path]:
+            if k < want: self._entries.move_to_end((path, k), last=False)
+        return img
+
+    def discard(self, path):
+        for level in self._levels.pop(path, ()):
+            self._bytes -= self._cost(self._entries.pop((path, level)))
+        self._base_width.pop(path, None)
+
+    def clear(self):
+        self._entries.clear(); self._levels.clear(); self._base_width.clear(); self._bytes = 0
+
+    def _add(self, path, level, img):
+        key = (path, level)
+        if key in self._entries: self._bytes -= self._cost(self._entries[key])
+        self._entries[key] = img
+        self._entries.move_to_end(key)
+        self._levels.setdefault(path, set()).add(level)
+        self._bytes += self._cost(img)
+        # 刚放进来的这一张不淘汰
+        while self._bytes > self.budget_bytes and len(self._entries) > 1:
+            (p, k), old = self._entries.popitem(last=False)
+            self._bytes -= self._cost(old)
+            self._levels[p].discard(k)
+            if not self._levels[p]: del self._levels[p]
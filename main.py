@@ -5,8 +5,21 @@ import json
 import re
 import platform
 import sys
+import multiprocessing
+import threading
+import queue
+import time
+import bisect
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageTk
 from tkinterdnd2 import DND_FILES, TkinterDnD
+from stitch_engine import export_strip, ExportCancelled, IMAGE_EXTS, BG_THEMES, strip_height, preview_slots, nearest_slot, reorder
+from image_cache import ThumbnailCache, LogoCache, PreviewStore, ResizeCache
+from stitch_ingest import scan_images
+from stitch_watch import FolderWatcher, IncrementalStrip
+from stitch_project import save_project, load_project, verify_photos, PROJECT_EXT
+from stitch_profile import ExportStats, profiling_enabled, profile_logger, log_record, hit_rate
 
 # --- 1. 获取当前系统类型 ---
 # 'Darwin' 代表 Mac, 'Windows' 代表 Windows
@@ -56,6 +69,19 @@ else:
 # --- 配置文件路径 ---
 # 自动存入用户的“文档”文件夹，Win/Mac 通用
 CONFIG_FILE = os.path.join(os.path.expanduser("~"), "Documents", "aoi_stitcher_config.json")
+# 预览缩略图的磁盘缓存，和配置文件放在一起
+THUMB_CACHE_DIR = os.path.join(os.path.dirname(CONFIG_FILE), "aoi_stitcher_thumbs")
+# 导出用的“已缩放整图”缓存，重复导出时跳过解码和缩放。
+# 动辄上 GB，放系统的缓存目录（不进“文稿”，免得被 iCloud / OneDrive 同步）
+if CURRENT_SYSTEM == "Darwin":
+    CACHE_ROOT = os.path.join(os.path.expanduser("~"), "Library", "Caches", "AoiStitcher")
+elif CURRENT_SYSTEM == "Windows":
+    CACHE_ROOT = os.path.join(os.environ.get("LOCALAPPDATA") or tempfile.gettempdir(), "AoiStitcher", "Cache")
+else:
+    CACHE_ROOT = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "aoistitcher")
+RESIZE_CACHE_DIR = os.path.join(CACHE_ROOT, "resized")
+# 性能记录（AOI_PROFILE=1 或配置 "profile": true 时才写）
+PROFILE_LOG = os.path.join(os.path.dirname(CONFIG_FILE), "aoi_stitcher_profile.log")
 
 # --- iOS 极简配色 (保持不变) ---
 BG_MAIN = "#000000"           
@@ -66,66 +92,83 @@ ACCENT_RED = "#FF453A"
 TEXT_PRIMARY = "#FFFFFF"
 TEXT_SECONDARY = "#8E8E93"   
 INPUT_BG = "#2C2C2E"
+TILE_LOADING_BG = "#2C2C2E"   # 缩略图还没解码完时的占位色
+PARK_Y = -100000              # 视口外的照片整组停在这里（滚动区域从 0 开始，看不到）
+DEL_MIN_SIDE = 36             # 照片缩到比这还小就不画删除按钮（canvas item 不会被裁剪，会盖到隔壁）
+
+class PreviewTile:
+    # 预览画布上的一张照片。不再是一棵 Frame/Label 控件树，只是同一个 tk.Canvas 上
+    # 共用一个 tag 的几个 item：加载占位块、图像、选中框、删除按钮。
+    # x/y/w/h 是槽位；item 只在视口里时才摆在槽位上（show），离开视口就整组停到 PARK_Y（park）
+    _serial = 0
 
-class DraggableTile(tk.Frame):
-    def __init__(self, master, image_path, pil_img, index, controller, **kwargs):
-        super().__init__(master, bd=0, highlightthickness=0, bg=BG_MAIN, **kwargs)
+    def __init__(self, board, image_path, index):
+        PreviewTile._serial += 1
+        self.board = board
+        self.tag = f"tile{PreviewTile._serial}"
         self.image_path = image_path
-        self.raw_pil = pil_img  
         self.index = index
-        self.controller = controller
         self.is_dragging = False
-        
-        self.inner_frame = tk.Frame(self, bd=0, bg=BG_MAIN, highlightthickness=0)
-        self.inner_frame.pack(fill="both", expand=True, padx=2, pady=2)
-        
-        self.image_label = tk.Label(self.inner_frame, bd=0, highlightthickness=0, bg=BG_MAIN)
-        self.image_label.pack(fill="both", expand=True) 
+        self.x = self.y = self.w = self.h = 0
+        self.drawn = None   # item 实际所在的 (x, y, w, h)，None = 还没摆过
+        self.shown = False
 
-        # 删除按钮微调
         del_font = ("Arial", 9, "bold") if CURRENT_SYSTEM != "Windows" else ("Arial", 8, "bold")
-        self.del_btn = tk.Label(self, text="✕", fg="white", bg="#333", font=del_font, 
-                                width=2, height=1, cursor=CURSOR_HAND)
-        self.del_btn.place(relx=1.0, x=-8, y=8, anchor="ne")
-        self.del_btn.bind("<Button-1>", lambda e: self.controller.delete_specific(self.index))
-        self.del_btn.bind("<Enter>", lambda e: self.del_btn.config(bg=ACCENT_RED))
-        self.del_btn.bind("<Leave>", lambda e: self.del_btn.config(bg="#333"))
-
-        for widget in (self.image_label, self.inner_frame):
-            widget.bind("<Button-1>", self.on_click) 
-            widget.bind("<ButtonPress-1>", self.start_drag, add="+")
-            widget.bind("<B1-Motion>", self.do_drag)
-            widget.bind("<ButtonRelease-1>", self.stop_drag)
-
-    def on_click(self, event):
-        self.controller.set_selected(self)
-
-    def start_drag(self, event):
-        self.is_dragging = False 
-        self.start_mouse_y = event.y_root
-        self.start_widget_y = self.winfo_y()
-        self.lift()
-        self.config(cursor=CURSOR_DRAG)
-        self.controller.prepare_magnetic_slots()
-
-    def do_drag(self, event):
-        delta_y = event.y_root - self.start_mouse_y
-        if not self.is_dragging and abs(delta_y) > 2:
-            self.is_dragging = True
-            self.controller.set_selected(self)
-
-        if self.is_dragging:
-            new_y = self.start_widget_y + delta_y
-            self.place(y=new_y)
-            center_y = new_y + (self.winfo_height() / 2)
-            self.controller.preview_magnetic_shift(self, center_y)
-
-    def stop_drag(self, event):
-        if self.is_dragging:
-            self.controller.apply_new_order(self)
-        self.is_dragging = False
-        self.config(cursor="arrow")
-        self.master.after_idle(self.controller.realign_all)
+        self.loading_item = board.create_rectangle(0, 0, 0, 0, width=0, fill=TILE_LOADING_BG, tags=(self.tag, "tile"))
+        self.image_item = board.create_image(0, 0, anchor="nw", tags=(self.tag, "tile"))
+        self.select_item = board.create_rectangle(0, 0, 0, 0, width=2, outline=ACCENT_BLUE, state="hidden", tags=(self.tag, "tile"))
+        self.del_bg_item = board.create_rectangle(0, 0, 0, 0, width=0, fill="#333", tags=(self.tag, "del"))
+        self.del_text_item = board.create_text(0, PARK_Y, text="✕", fill="white", font=del_font, tags=(self.tag, "del"))
+
+    def items(self):
+        return (self.loading_item, self.image_item, self.select_item, self.del_bg_item, self.del_text_item)
+
+    def place(self, x, y, w, h):
+        # 只记下槽位，不碰画布
+        self.x, self.y, self.w, self.h = x, y, w, h
+
+    def show(self):
+        # 把 item 摆到槽位上：已在位时不调用 Tk，只是上下平移时一次 move
+        self.shown = True
+        x, y, w, h = geom = (self.x, self.y, self.w, self.h)
+        d = self.drawn
+        if geom == d: return
+        self.drawn = geom
+        b = self.board
+        if d is not None and (d[0], d[2], d[3]) == (x, w, h):
+            b.move(self.tag, 0, y - d[1]); return
+        # 和原来的 Frame 布局一致：图像四周内缩 2px，删除按钮在右上角 (-8, 8)
+        b.coords(self.loading_item, x + 2, y + 2, x + w - 2, y + h - 2)
+        b.coords(self.image_item, x + 2, y + 2)
+        b.coords(self.select_item, x + 1, y + 1, x + w - 1, y + h - 1)
+        b.coords(self.del_bg_item, x + w - 30, y + 8, x + w - 8, y + 28)
+        b.coords(self.del_text_item, x + w - 19, y + 18)
+        del_state = "hidden" if w < DEL_MIN_SIDE or h < DEL_MIN_SIDE else "normal"
+        b.itemconfig(self.del_bg_item, state=del_state)
+        b.itemconfig(self.del_text_item, state=del_state)
+
+    def park(self):
+        # 离开视口：整组 item 挪走，一次 Tk 调用
+        if not self.shown: return
+        self.shown = False
+        x, y, w, h = self.drawn
+        self.board.move(self.tag, 0, PARK_Y - y)
+        self.drawn = (x, PARK_Y, w, h)
+
+    def move_to(self, y):
+        # 拖动中的槽位变化；视口外的只记下，进入视口时再摆
+        self.y = y
+        if self.shown: self.show()
+
+    def set_preview(self, photo):
+        self.board.itemconfig(self.image_item, image=photo or "")
+        self.board.itemconfig(self.loading_item, state="hidden" if photo else "normal")
+
+    def set_selected(self, on):
+        self.board.itemconfig(self.select_item, state="normal" if on else "hidden")
+
+    def destroy(self):
+        self.board.delete(self.tag)
 
 class AoiStitcher:
     def __init__(self, root):
@@ -141,34 +184,83 @@ class AoiStitcher:
         self.root.configure(bg=BG_MAIN)
         
         self.image_paths = []
-        self.tile_widgets = []
+        self.tiles = []
         self.img_ratios = [] 
         self.preview_cache = {} 
         self.selected_tile = None 
         self.last_p_tw = 0      
         self.slot_y_coords = [] 
         self.potential_idx = 0  
+        self.ui_queue = queue.Queue()  # 后台线程 → Tk 主线程的唯一通道
+        self.export_cancel = None       # 导出进行中时是一个 threading.Event
+        self.relayout_job = None        # 已排队的重排 (root.after id)
+        self.relayout_force = False
+        self.last_layout_sig = None
+        self.zoom = 1.0                 # 1.0 = 整条缩放到一屏；放大后可以上下滚动
+        self.max_zoom = 1.0
+        self.viewport_job = None
+        self.live_tiles = set()         # 在视口（含余量）里、item 摆在槽位上的照片
+        self.slot_tops = []             # 上次重排时每个槽位的 y，视口查找用
+        self.slot_order = None          # 拖动中各槽位上是第几张；None = 按顺序
+        self.thumb_pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
         
         self.config = {
             "width": "2000", "spacing": "20", "bottom_h": "250", 
             "logo_path": "", "logo_library": [], "logo_scale": 20, 
             "logo_offset_x": 0, "logo_offset_y": 0,
-            "bg_theme": "White", 
+            "bg_theme": "White", "export_tier": "full",
+            "export_workers": 0, "export_pool": "thread",  # 0 = 按 CPU 核数自动
+            "compose_backend": "pil",  # "numpy" = 用 NumPy 数组合成（需安装 numpy）
+            "thumb_cache_mb": 512, "preview_budget_mb": 256, "resize_cache_mb": 0,  # 导出缩放结果的缓存 (MB)，0 = 关闭；只导出一次时写缓存反而更慢，常反复导出同一批照片再打开（如 1024）
+            "split_max_height": 0, "split_max_mb": 0,      # 分卷导出，0 = 不限（超过 JPEG 上限仍会自动分卷）
+            "import_order": "name",  # 文件夹导入的排序："name" 文件名自然顺序，"exif" 拍摄时间
+            "watch_interval": 2.0,  # 监视文件夹的轮询间隔（秒）；文件停止变化这么久才算写完
+            "profile": False,  # 记录导出分阶段耗时和缓存命中率，见 stitch_profile
+            "extra_outputs": [],  # 一次导出附带的小尺寸版本，如 {"width": 1080, "format": "WEBP", "quality": 85}
             "last_img_dir": os.path.expanduser("~/Desktop"),
             "last_export_dir": os.path.expanduser("~/Desktop"),
             "last_logo_dir": os.path.expanduser("~/Desktop")
         }
         self.bg_map = {
-            "White": {"hex": "#FFFFFF", "rgb": (255, 255, 255)},
-            "Black": {"hex": "#000000", "rgb": (0, 0, 0)}
+            "White": {"hex": "#FFFFFF", "rgb": BG_THEMES["White"]},
+            "Black": {"hex": "#000000", "rgb": BG_THEMES["Black"]}
         }
         
         self.load_settings()
+        self.thumb_cache = ThumbnailCache(THUMB_CACHE_DIR, self.config["thumb_cache_mb"])
+        self.logo_cache = LogoCache()
+        self.resize_cache = ResizeCache(RESIZE_CACHE_DIR, self.config["resize_cache_mb"]) if self.config["resize_cache_mb"] else None
+        self.preview_store = PreviewStore(self.config["preview_budget_mb"])
+        self.preview_pending = set()  # 正在后台读取缩略图的路径
+        self.photo_hits = self.photo_misses = 0  # preview_cache 命中计数
+        self.profile_log = profile_logger(PROFILE_LOG) if profiling_enabled(self.config) else None
+        self.export_stats = None
+        self.scan_gen = 0  # 清空画布时加一，正在扫描的文件夹结果作废
+        self.watch = None  # 监视模式进行中时是一个 dict，见 toggle_watch
+        self.project_path = None  # 当前打开 / 保存过的 .aoiproj
         self.setup_ui()
         self.toggle_placeholder()
         
         self.root.bind("<BackSpace>", self.delete_selected)
         self.root.bind("<Delete>", self.delete_selected)
+        mod = "Command" if CURRENT_SYSTEM == "Darwin" else "Control"
+        self.root.bind(f"<{mod}-s>", lambda e: self.save_project_action())
+        self.root.bind(f"<{mod}-o>", lambda e: self.open_project_action())
+        self.root.after(30, self.poll_ui_queue)
+
+    def post(self, fn, *args):
+        # 后台线程不能直接碰 Tk 控件，统一排队，由 poll_ui_queue 在主线程里执行
+        self.ui_queue.put((fn, args))
+
+    def poll_ui_queue(self):
+        try:
+            while True:
+                fn, args = self.ui_queue.get_nowait()
+                try: fn(*args)
+                except Exception as e: print(f"UI callback error: {e}")
+        except queue.Empty:
+            pass
+        self.root.after(30, self.poll_ui_queue)
 
     def load_settings(self):
         # 增加 encoding='utf-8' 防止 Windows 读取中文路径报错
@@ -183,7 +275,8 @@ class AoiStitcher:
             "width": self.width_entry.get(),
             "spacing": self.spacing_entry.get(),
             "bottom_h": self.bottom_entry.get(),
-            "bg_theme": self.bg_var.get()
+            "bg_theme": self.bg_var.get(),
+            "export_tier": self.tier_var.get()
         })
         try:
             # 确保目录存在
@@ -215,7 +308,17 @@ class AoiStitcher:
         
         # 兼容性处理：Windows 的 Radiobutton 样式调整
         for text in ["White", "Black"]:
-            tk.Radiobutton(bg_frame, text=text, variable=self.bg_var, value=text, command=self.realign_all, 
+            tk.Radiobutton(bg_frame, text=text, variable=self.bg_var, value=text, command=self.request_relayout, 
+                          bg=SIDEBAR_BG, fg=TEXT_PRIMARY, selectcolor="#333", activebackground=SIDEBAR_BG,
+                          font=FONT_BODY).pack(side="left", padx=(0, 15))
+
+        # 导出质量：成品 = 全尺寸解码 + LANCZOS；打样 = 缩小解码 + 快速编码，排版不变
+        tk.Label(self.sidebar, text="导出质量", fg=TEXT_SECONDARY, bg=SIDEBAR_BG, font=FONT_BODY).pack(anchor="w")
+        self.tier_var = tk.StringVar(value=self.config["export_tier"])
+        tier_frame = tk.Frame(self.sidebar, bg=SIDEBAR_BG)
+        tier_frame.pack(fill="x", pady=(8, 25))
+        for text, value in [("成品", "full"), ("打样", "proof")]:
+            tk.Radiobutton(tier_frame, text=text, variable=self.tier_var, value=value,
                           bg=SIDEBAR_BG, fg=TEXT_PRIMARY, selectcolor="#333", activebackground=SIDEBAR_BG,
                           font=FONT_BODY).pack(side="left", padx=(0, 15))
 
@@ -224,11 +327,20 @@ class AoiStitcher:
         if CURRENT_SYSTEM == "Darwin": btn_kwargs["borderless"] = 1
             
         MacButton(self.sidebar, text="＋ 导入照片", command=self.add_images, **btn_kwargs).pack(fill="x", pady=6, ipady=10)
+        MacButton(self.sidebar, text="＋ 导入文件夹", command=self.add_folder, **btn_kwargs).pack(fill="x", pady=6, ipady=10)
         
         # 调整颜色
         btn_kwargs["bg"] = "#3A3A3C"
         MacButton(self.sidebar, text="配置水印 ▾", command=self.show_logo_menu, **btn_kwargs).pack(fill="x", pady=6, ipady=10)
         
+        self.watch_btn = MacButton(self.sidebar, text="监视文件夹", command=self.toggle_watch, **btn_kwargs)
+        self.watch_btn.pack(fill="x", pady=6, ipady=10)
+
+        project_row = tk.Frame(self.sidebar, bg=SIDEBAR_BG)
+        project_row.pack(fill="x")
+        MacButton(project_row, text="打开项目", command=self.open_project_action, **btn_kwargs).pack(side="left", fill="x", expand=True, pady=6, ipady=10, padx=(0, 3))
+        MacButton(project_row, text="保存项目", command=self.save_project_action, **btn_kwargs).pack(side="left", fill="x", expand=True, pady=6, ipady=10, padx=(3, 0))
+
         btn_kwargs["fg"] = ACCENT_RED
         MacButton(self.sidebar, text="清空画布", command=self.clear_all, **btn_kwargs).pack(fill="x", pady=6, ipady=10)
 
@@ -248,6 +360,10 @@ class AoiStitcher:
         self.path_label.pack(side="left", fill="x", expand=True)
         tk.Label(path_box, text="›", fg="#444", bg="#252527", font=("Arial", 12)).pack(side="right")
         self.update_path_display()
+        # 性能记录打开时才显示的状态行
+        self.status_label = tk.Label(export_container, text="", fg=TEXT_SECONDARY, bg=SIDEBAR_BG, font=FONT_MONO,
+                                     anchor="w", justify="left", wraplength=240)
+        if self.profile_log: self.status_label.pack(fill="x", pady=(8, 0))
 
         # --- 工作预览区 ---
         self.stage = tk.Frame(self.root, bg=BG_MAIN)
@@ -260,10 +376,30 @@ class AoiStitcher:
                                           fg="#444446", bg="#000000", font=FONT_BIG_BTN, justify="center")
         self.placeholder_label.place(relx=0.5, rely=0.5, anchor="center")
         
-        self.canvas_bg_frame = tk.Frame(self.stage, bd=0)
-        self.logo_label = tk.Label(self.stage, bd=0)
-        self.logo_label.bind("<Button-1>", lambda e: self.show_logo_menu())
-        self.stage.bind("<Configure>", lambda e: self.realign_all())
+        # 整条预览画在一个 Canvas 上：背景、所有照片和水印都是它的 item
+        self.board = tk.Canvas(self.stage, bg=BG_MAIN, bd=0, highlightthickness=0)
+        self.board.pack(fill="both", expand=True)
+        self.board.drop_target_register(DND_FILES)
+        self.board.dnd_bind('<<Drop>>', self.handle_drop)
+        self.bg_item = self.board.create_rectangle(0, 0, 0, 0, width=0, state="hidden")
+        self.logo_item = self.board.create_image(0, 0, anchor="nw", state="hidden", tags=("logo",))
+        self.logo_src = None
+        self.tile_by_item = {}
+        self.drag_tile = None
+        
+        self.board.bind("<ButtonPress-1>", self.on_board_press)
+        self.board.bind("<B1-Motion>", self.on_board_drag)
+        self.board.bind("<ButtonRelease-1>", self.on_board_release)
+        self.board.tag_bind("del", "<Enter>", lambda e: self.hover_delete(True))
+        self.board.tag_bind("del", "<Leave>", lambda e: self.hover_delete(False))
+        # 滚轮上下滚动，Ctrl + 滚轮缩放（Linux 的滚轮是 Button-4/5）
+        self.board.bind("<MouseWheel>", lambda e: self.on_wheel(e.delta))
+        self.board.bind("<Control-MouseWheel>", lambda e: self.on_zoom(e.delta))
+        self.board.bind("<Button-4>", lambda e: self.on_wheel(120))
+        self.board.bind("<Button-5>", lambda e: self.on_wheel(-120))
+        self.board.bind("<Control-Button-4>", lambda e: self.on_zoom(120))
+        self.board.bind("<Control-Button-5>", lambda e: self.on_zoom(-120))
+        self.stage.bind("<Configure>", lambda e: self.request_relayout())
 
     def update_path_display(self):
         path = self.config.get("last_export_dir", "未选择路径")
@@ -274,7 +410,9 @@ class AoiStitcher:
     def toggle_placeholder(self):
         if not self.image_paths:
             self.placeholder.place(relx=0.05, rely=0.05, relwidth=0.9, relheight=0.9)
-            self.canvas_bg_frame.place_forget()
+            self.placeholder.lift()
+            self.board.itemconfig(self.bg_item, state="hidden")
+            self.board.itemconfig(self.logo_item, state="hidden")
         else:
             self.placeholder.place_forget()
 
@@ -283,33 +421,85 @@ class AoiStitcher:
         entry = tk.Entry(self.sidebar, bg=INPUT_BG, fg=TEXT_PRIMARY, insertbackground="white", relief="flat", font=FONT_BODY, borderwidth=5)
         entry.insert(0, self.config[key])
         entry.pack(fill="x", ipady=4) 
-        entry.bind("<KeyRelease>", lambda e: self.realign_all())
+        entry.bind("<KeyRelease>", lambda e: self.request_relayout())
         return entry
 
+    def item_tile(self):
+        # 画布命中测试：鼠标下的 item → 所属的 PreviewTile
+        hit = self.board.find_withtag("current")
+        return self.tile_by_item.get(hit[0]) if hit else None
+
+    def hover_delete(self, on):
+        tile = self.item_tile()
+        if tile is None: return
+        self.board.itemconfig(tile.del_bg_item, fill=ACCENT_RED if on else "#333")
+        self.board.config(cursor=CURSOR_HAND if on else "")
+
+    def on_board_press(self, event):
+        hit = self.board.find_withtag("current")
+        if not hit: return
+        if "logo" in self.board.gettags(hit[0]): self.show_logo_menu(); return
+        tile = self.tile_by_item.get(hit[0])
+        if tile is None: return
+        if "del" in self.board.gettags(hit[0]):
+            self.delete_specific(tile.index); return
+        self.set_selected(tile)
+        tile.is_dragging = False
+        # 用画布坐标记录抓取点，拖动途中自动滚动也不会错位
+        cy = self.board.canvasy(event.y)
+        self.drag_tile, self.drag_start_y, self.drag_grab = tile, cy, cy - tile.y
+        self.board.tag_raise(tile.tag)
+        self.board.config(cursor=CURSOR_DRAG)
+        self.prepare_magnetic_slots()
+
+    def on_board_drag(self, event):
+        tile = self.drag_tile
+        if tile is None: return
+        cy = self.board.canvasy(event.y)
+        if not tile.is_dragging and abs(cy - self.drag_start_y) > 2:
+            tile.is_dragging = True
+        if tile.is_dragging:
+            # 拖到视口边缘时自动滚动
+            if event.y < 40: self.board.yview_scroll(-1, "units"); self.schedule_viewport()
+            elif event.y > self.board.winfo_height() - 40: self.board.yview_scroll(1, "units"); self.schedule_viewport()
+            tile.move_to(self.board.canvasy(event.y) - self.drag_grab)
+            self.preview_magnetic_shift(tile, tile.y + tile.h / 2)
+
+    def on_board_release(self, event):
+        tile, self.drag_tile = self.drag_tile, None
+        self.board.config(cursor="")
+        if tile is None: return
+        if tile.is_dragging: self.apply_new_order(tile)
+        tile.is_dragging = False
+        self.request_relayout(force=True)  # 拖完要把自己放回槽位，即使顺序没变
+
     def prepare_magnetic_slots(self):
-        self.slot_y_centers = [t.winfo_y() + t.winfo_height()/2 for t in self.tile_widgets]
-        self.slot_y_coords = [t.winfo_y() for t in self.tile_widgets]
+        self.slot_y_centers = [t.y + t.h/2 for t in self.tiles]
+        self.slot_y_coords = [t.y for t in self.tiles]
+        self.potential_idx = self.drag_tile.index if self.drag_tile else 0
 
     def preview_magnetic_shift(self, dragging_tile, center_y):
         if not self.slot_y_centers: return
-        distances = [abs(center_y - cy) for cy in self.slot_y_centers]
-        new_p_idx = distances.index(min(distances))
+        new_p_idx = nearest_slot(self.slot_y_centers, center_y)
         if new_p_idx != self.potential_idx:
             self.potential_idx = new_p_idx
-            temp_order = [idx for idx in range(len(self.tile_widgets)) if idx != dragging_tile.index]
-            temp_order.insert(self.potential_idx, dragging_tile.index)
+            temp_order = reorder(len(self.tiles), dragging_tile.index, self.potential_idx)
+            self.slot_order = temp_order
+            # 只移动槽位真正变了的那几张
             for pos_in_view, tile_idx in enumerate(temp_order):
-                target = self.tile_widgets[tile_idx]
-                if not getattr(target, 'is_dragging', False): target.place(y=self.slot_y_coords[pos_in_view])
+                target = self.tiles[tile_idx]
+                if not target.is_dragging: target.move_to(self.slot_y_coords[pos_in_view])
+            self.schedule_viewport()
 
     def apply_new_order(self, dragging_tile):
         old_idx = dragging_tile.index
         new_idx = self.potential_idx
         if old_idx != new_idx:
             self.image_paths.insert(new_idx, self.image_paths.pop(old_idx))
-            self.tile_widgets.insert(new_idx, self.tile_widgets.pop(old_idx))
+            self.tiles.insert(new_idx, self.tiles.pop(old_idx))
             self.img_ratios.insert(new_idx, self.img_ratios.pop(old_idx))
-            for i, t in enumerate(self.tile_widgets): t.index = i
+            for i, t in enumerate(self.tiles): t.index = i
+        self.slot_order = None  # 新顺序就是拖动时各槽位上的顺序
 
     def show_logo_menu(self):
         # Windows 菜单字体适配
@@ -366,7 +556,7 @@ class AoiStitcher:
 
     def update_logo_config(self, key, value):
         self.config[key] = int(value)
-        self.realign_all()
+        self.request_relayout()
 
     def reset_logo_pos(self, panel):
         self.config["logo_offset_x"] = 0
@@ -374,15 +564,38 @@ class AoiStitcher:
         self.config["logo_scale"] = 20
         self.save_settings()
         panel.destroy()
-        self.realign_all()
+        self.request_relayout()
 
     def apply_logo(self, path): 
-        self.config["logo_path"] = path; self.save_settings(); self.realign_all()
+        self.config["logo_path"] = path; self.save_settings(); self.request_relayout()
+
+    def request_relayout(self, force=False):
+        # 键盘、窗口缩放、滑块等触发的重排请求合并成每帧（约 16ms）最多一次
+        self.relayout_force = self.relayout_force or force
+        if self.relayout_job is None:
+            self.relayout_job = self.root.after(16, self.run_relayout)
+
+    def run_relayout(self):
+        self.relayout_job = None
+        force, self.relayout_force = self.relayout_force, False
+        self.root.update_idletasks()
+        sig = self.layout_signature()
+        # 输入和上一次完全一样就跳过整趟重排
+        if not force and sig == self.last_layout_sig: return
+        self.last_layout_sig = sig
+        self.realign_all()
+
+    def layout_signature(self):
+        return (self.stage.winfo_width(), self.stage.winfo_height(), self.zoom,
+                self.width_entry.get(), self.spacing_entry.get(), self.bottom_entry.get(), self.bg_var.get(),
+                tuple(t.tag for t in self.tiles),  # tag 全局唯一，id() 在清空后可能被新 tile 复用
+                self.config["logo_path"], self.config["logo_scale"],
+                self.config["logo_offset_x"], self.config["logo_offset_y"])
 
     def realign_all(self, event=None):
+        # 真正的重排；外部请用 request_relayout，不要直接调用
         if not self.image_paths: self.toggle_placeholder(); return
         self.toggle_placeholder()
-        self.root.update_idletasks()
         
         sw = max(self.stage.winfo_width()-60, 100)
         sh = max(self.stage.winfo_height()-40, 100)
@@ -390,68 +603,157 @@ class AoiStitcher:
         try:
             tw, sp, bh = int(self.width_entry.get()), int(self.spacing_entry.get()), int(self.bottom_entry.get())
             bg_hex = self.bg_map[self.bg_var.get()]["hex"]
-            total_h = sum(int(tw * r) for r in self.img_ratios) + (len(self.img_ratios)-1)*sp + bh
-            scale = min(sw/tw, sh/total_h)
+            total_h = strip_height(self.img_ratios, tw, sp, bh)
+            # zoom = 1 时整条放进一屏；放大上限是“宽度撑满”，再长的部分靠滚动
+            fit = min(sw/tw, sh/total_h)
+            self.max_zoom = max((sw/tw) / fit, 1.0)
+            self.zoom = min(self.zoom, self.max_zoom)
+            scale = fit * self.zoom
             p_tw, p_sp, p_bh = int(tw * scale), int(sp * scale), int(bh * scale)
-            curr_y = (self.stage.winfo_height() - int(total_h * scale)) // 2
+            stage_h = self.stage.winfo_height()
+            curr_y = max((stage_h - int(total_h * scale)) // 2, 20)
             start_x = (self.stage.winfo_width() - p_tw) // 2
+            self.board.config(scrollregion=(0, 0, self.stage.winfo_width(), max(stage_h, curr_y + int(total_h * scale) + 20)))
             
-            self.canvas_bg_frame.config(bg=bg_hex, width=p_tw, height=int(total_h * scale))
-            self.canvas_bg_frame.place(x=start_x, y=curr_y)
+            self.board.itemconfig(self.bg_item, fill=bg_hex, state="normal")
+            self.board.coords(self.bg_item, start_x, curr_y, start_x + p_tw, curr_y + int(total_h * scale))
             
-            if p_tw != self.last_p_tw: self.preview_cache.clear(); self.last_p_tw = p_tw
+            resized = p_tw != self.last_p_tw
+            if resized: self.preview_cache.clear(); self.last_p_tw = p_tw
             
-            for i, tile in enumerate(self.tile_widgets):
-                ph = int(p_tw * self.img_ratios[i])
-                if not getattr(tile, 'is_dragging', False):
-                    cache_key = tile.image_path
-                    if cache_key not in self.preview_cache:
-                        self.preview_cache[cache_key] = ImageTk.PhotoImage(tile.raw_pil.resize((p_tw-4, ph-4), Image.Resampling.BICUBIC))
-                    
-                    tile.inner_frame.config(bg=bg_hex)
-                    if self.selected_tile == tile:
-                        tile.inner_frame.config(highlightthickness=2, highlightbackground=ACCENT_BLUE)
-                    else:
-                        tile.inner_frame.config(highlightthickness=0)
-                    tile.image_label.config(image=self.preview_cache[cache_key], bg=bg_hex)
-                    tile.place(x=start_x, y=curr_y, width=p_tw, height=ph)
-                curr_y += ph + p_sp
+            # 这里只记槽位，不调用 Tk；摆 item 和生成 PhotoImage 都交给 update_viewport 按可见区域做
+            slots = preview_slots(self.img_ratios, p_tw, p_sp, curr_y)
+            for tile, (y, ph) in zip(self.tiles, slots):
+                if not tile.is_dragging: tile.place(start_x, y, p_tw, ph)
+            self.slot_tops, self.slot_order = [y for y, _ in slots], None
+            curr_y = slots[-1][0] + slots[-1][1] + p_sp
+            self.update_viewport(refresh=resized)
             
             if self.config["logo_path"] and os.path.exists(self.config["logo_path"]):
-                with Image.open(self.config["logo_path"]).convert("RGBA") as l_img:
-                    lw = int(p_tw * (self.config["logo_scale"] / 100))
-                    if lw <= 0: lw = 1 
-                    lh = int(l_img.size[1] * (lw / l_img.size[0]))
-                    if lh <= 0: lh = 1
-                    
-                    tk_l = ImageTk.PhotoImage(l_img.resize((lw, lh), Image.Resampling.LANCZOS))
-                    self.logo_label.config(image=tk_l, bg=bg_hex); self.logo_label.image = tk_l
-                    
-                    base_x = (self.stage.winfo_width() - lw) // 2
-                    base_y = curr_y - p_sp + (p_bh - lh) // 2
-                    final_x = base_x + int(self.config["logo_offset_x"] * scale)
-                    final_y = base_y + int(self.config["logo_offset_y"] * scale)
-                    self.logo_label.place(x=final_x, y=final_y)
-            else: self.logo_label.place_forget()
+                # 解码和缩放都走 logo_cache，拖滑块时同一宽度不会重复 LANCZOS
+                l_img = self.logo_cache.resized(self.config["logo_path"], int(p_tw * (self.config["logo_scale"] / 100)))
+                lw, lh = l_img.size
+                if self.logo_src is not l_img:
+                    self.logo_tk = ImageTk.PhotoImage(l_img); self.logo_src = l_img
+                    self.board.itemconfig(self.logo_item, image=self.logo_tk)
+                
+                base_x = (self.stage.winfo_width() - lw) // 2
+                base_y = curr_y - p_sp + (p_bh - lh) // 2
+                final_x = base_x + int(self.config["logo_offset_x"] * scale)
+                final_y = base_y + int(self.config["logo_offset_y"] * scale)
+                self.board.coords(self.logo_item, final_x, final_y)
+                self.board.itemconfig(self.logo_item, state="normal")
+                self.board.tag_raise(self.logo_item)  # 和导出一致，水印盖在照片上面
+            else: self.board.itemconfig(self.logo_item, state="hidden")
         except Exception:
             pass
 
+    def on_wheel(self, delta):
+        if not self.tiles: return
+        self.board.yview_scroll(-1 if delta > 0 else 1, "units")
+        self.schedule_viewport()
+
+    def on_zoom(self, delta):
+        zoom = min(max(self.zoom * (1.25 if delta > 0 else 0.8), 1.0), self.max_zoom)
+        if zoom != self.zoom:
+            self.zoom = zoom; self.request_relayout()
+
+    def schedule_viewport(self):
+        if self.viewport_job is None:
+            self.viewport_job = self.root.after(16, self.update_viewport)
+
+    def visible_range(self):
+        # 当前可见区域上下各多留一屏，滚动时不会先看到占位块
+        top = self.board.canvasy(0)
+        bottom = self.board.canvasy(self.board.winfo_height())
+        margin = bottom - top
+        return top - margin, bottom + margin
+
+    def tile_in_view(self, tile, view=None):
+        lo, hi = view or self.visible_range()
+        return tile.y + tile.h >= lo and tile.y <= hi
+
+    def update_viewport(self, refresh=False):
+        # 只有与视口（含余量）相交的照片摆在画布上并持有 PhotoImage。
+        # 可见的几张按槽位二分查找，只处理进出视口的照片，
+        # 内存和每次滚动的开销跟屏幕上看得到的张数有关，跟整条有多长无关。
+        # refresh=True（预览宽度变了）时视口里的照片都重新生成 PhotoImage
+        self.viewport_job = None
+        if not self.tiles or not self.last_p_tw or len(self.slot_tops) != len(self.tiles): return
+        view = self.visible_range()
+        # 拖动中槽位上的照片高度和槽位不完全一致，两头各多看一格
+        first = max(bisect.bisect_left(self.slot_tops, view[0]) - 2, 0)
+        last = min(bisect.bisect_right(self.slot_tops, view[1]) + 1, len(self.tiles))
+        order = self.slot_order
+        near = [self.tiles[order[i] if order else i] for i in range(first, last)]
+        if self.drag_tile is not None: near.append(self.drag_tile)
+        live = {t for t in near if self.tile_in_view(t, view)}
+        for tile in self.live_tiles - live:
+            tile.park(); tile.set_preview(None)
+        for tile in live:
+            tile.show()
+            if refresh or tile not in self.live_tiles:
+                self.show_tile_preview(tile, self.last_p_tw, int(self.last_p_tw * self.img_ratios[tile.index]))
+        self.live_tiles = live
+        paths = {t.image_path for t in live}
+        for key in [k for k in self.preview_cache if k not in paths]:
+            del self.preview_cache[key]
+
+    def show_tile_preview(self, tile, p_tw, ph):
+        # 缩到不足 1px 的不生成图像
+        if p_tw <= 4 or ph <= 4:
+            tile.set_preview(None); return
+        cache_key = tile.image_path
+        if cache_key in self.preview_cache: self.photo_hits += 1
+        else:
+            self.photo_misses += 1
+            # 从金字塔里取宽度够用的最小一级；被淘汰了就先显示占位块，后台从磁盘缓存重建
+            src = self.preview_store.get(cache_key, p_tw - 4)
+            if src is None:
+                tile.set_preview(None); self.request_preview(cache_key); return
+            self.preview_cache[cache_key] = ImageTk.PhotoImage(src.resize((p_tw-4, ph-4), Image.Resampling.BICUBIC))
+        tile.set_preview(self.preview_cache[cache_key])
+
+    def request_preview(self, path):
+        if path in self.preview_pending: return
+        self.preview_pending.add(path)
+        future = self.thumb_pool.submit(self.thumb_cache.load, path, 1600)
+        future.add_done_callback(lambda f: self.post(self.on_preview_ready, path, f))
+
+    def on_preview_ready(self, path, future):
+        self.preview_pending.discard(path)
+        try:
+            img = future.result()
+        except Exception as e:
+            print(f"Error loading {path}: {e}"); return
+        # 只有还在视口里的才放进内存；视口外的这次只是把磁盘缓存预热好
+        view = self.visible_range() if self.last_p_tw else None
+        shown = [t for t in self.live_tiles if t.image_path == path and view and self.tile_in_view(t, view)]
+        if not shown: return
+        self.preview_store.put(path, img)
+        for tile in shown:
+            if not tile.is_dragging:
+                self.show_tile_preview(tile, self.last_p_tw, int(self.last_p_tw * self.img_ratios[tile.index]))
+
     def delete_specific(self, index):
         if 0 <= index < len(self.image_paths):
             p = self.image_paths.pop(index); self.img_ratios.pop(index)
-            self.tile_widgets.pop(index).destroy()
+            self.forget_tile(self.tiles.pop(index))
             if p in self.preview_cache: del self.preview_cache[p]
             self.selected_tile = None
-            for i, t in enumerate(self.tile_widgets): t.index = i
-            self.realign_all()
+            for i, t in enumerate(self.tiles): t.index = i
+            self.request_relayout()
+
+    def forget_tile(self, tile):
+        self.live_tiles.discard(tile)
+        for item in tile.items(): self.tile_by_item.pop(item, None)
+        tile.destroy()
 
     def set_selected(self, tile):
-        if self.selected_tile:
-            try: self.selected_tile.inner_frame.config(highlightthickness=0)
-            except: pass
+        if self.selected_tile and self.selected_tile is not tile:
+            self.selected_tile.set_selected(False)
         self.selected_tile = tile
-        if self.selected_tile:
-            self.selected_tile.inner_frame.config(highlightthickness=2, highlightbackground=ACCENT_BLUE)
+        if self.selected_tile: self.selected_tile.set_selected(True)
 
     def delete_selected(self, event=None):
         if self.selected_tile: self.delete_specific(self.selected_tile.index)
@@ -465,7 +767,7 @@ class AoiStitcher:
             self.apply_logo(p)
 
     def clear_logo(self): 
-        self.config["logo_path"] = ""; self.save_settings(); self.realign_all()
+        self.config["logo_path"] = ""; self.save_settings(); self.request_relayout()
 
     def handle_drop(self, event):
         raw_data = event.data
@@ -477,77 +779,303 @@ class AoiStitcher:
         for match in paths:
             p = match[0] if match[0] else match[1]
             p = p.strip('\"').strip('\'') # 去除可能存在的引号
-            if os.path.isfile(p) and p.lower().endswith(('.jpg', '.jpeg', '.png', '.psd', '.tiff', '.bmp')):
+            if p.lower().endswith(PROJECT_EXT) and os.path.isfile(p):
+                self.open_project(p); return
+            # 文件夹也收下，交给后台递归扫描
+            if os.path.isdir(p) or (os.path.isfile(p) and p.lower().endswith(IMAGE_EXTS)):
                 clean_paths.append(p)
 
-        if clean_paths: 
-            self.image_paths.extend(clean_paths)
-            self.config["last_img_dir"] = os.path.dirname(clean_paths[0])
-            self.init_load_images()
+        if clean_paths: self.ingest(clean_paths)
 
     def add_images(self):
         # 兼容 Windows 的分号分隔符
         ft = [("Images", "*.jpg;*.jpeg;*.png;*.psd;*.tiff;*.bmp")]
         p = filedialog.askopenfilenames(initialdir=self.config.get("last_img_dir"), filetypes=ft)
-        if p: 
-            self.image_paths.extend(list(p))
-            self.config["last_img_dir"] = os.path.dirname(p[0])
-            self.init_load_images()
-
-    def init_load_images(self):
-        for w in self.tile_widgets: w.destroy()
-        self.tile_widgets, self.img_ratios, self.preview_cache = [], [], {}
-        self.last_p_tw = 0
-        for i, p in enumerate(self.image_paths):
-            try:
-                with Image.open(p) as img:
-                    self.img_ratios.append(img.size[1] / img.size[0])
-                    prev = img.convert("RGB")
-                    prev.thumbnail((1600, 1600), Image.Resampling.LANCZOS)
-                    self.tile_widgets.append(DraggableTile(self.stage, p, prev, i, self))
-            except Exception as e:
-                print(f"Error loading {p}: {e}")
-        self.realign_all()
+        if p: self.ingest(list(p))
+
+    def add_folder(self):
+        d = filedialog.askdirectory(initialdir=self.config.get("last_img_dir"))
+        if d: self.ingest([d])
+
+    def ingest(self, paths):
+        # 文件和文件夹统一入口：后台线程扫描 + 读文件头，每扫到一批就交回主线程排上
+        first = paths[0]
+        self.config["last_img_dir"] = first if os.path.isdir(first) else os.path.dirname(first)
+        threading.Thread(target=self.run_scan, args=(paths, self.scan_gen), daemon=True).start()
+
+    def run_scan(self, paths, gen):
+        # 运行在后台线程；NAS 上读文件头也很慢，和校验一样并发做
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            for batch in scan_images(paths, order=self.config["import_order"]):
+                if gen != self.scan_gen: return
+                sizes = list(pool.map(self.probe_or_none, batch))
+                self.post(self.on_scan_batch, gen, batch, sizes)
+
+    def probe_or_none(self, path):
+        try:
+            return self.thumb_cache.probe_size(path)
+        except Exception as e:
+            print(f"Error loading {path}: {e}"); return None
+
+    def on_scan_batch(self, gen, paths, sizes):
+        if gen == self.scan_gen: self.init_load_images(paths, sizes)
+
+    def init_load_images(self, new_paths, sizes=None, ratios=None, prefetch=True):
+        # 第一阶段：只读文件头拿比例，立刻建 tile 排版（占位显示）；
+        # sizes 是后台扫描时已经读好的尺寸（读失败的为 None），ratios 是项目文件里存的高宽比
+        # 第二阶段：缩略图交给后台线程池（优先读磁盘缓存），按需放进预览金字塔；
+        # prefetch=False 时只有滚到视口里的才去取
+        new_tiles = []
+        t0 = time.perf_counter()
+        for i, p in enumerate(new_paths):
+            if ratios is not None: ratio = ratios[i]
+            else:
+                size = sizes[i] if sizes is not None else self.probe_or_none(p)
+                if size is None: continue
+                ratio = size[1] / size[0]
+            tile = PreviewTile(self.board, p, len(self.tiles))
+            for item in tile.items(): self.tile_by_item[item] = tile
+            self.tiles.append(tile); new_tiles.append(tile)
+            self.image_paths.append(p); self.img_ratios.append(ratio)
+        if self.profile_log:
+            log_record(self.profile_log, "import", {"images": len(new_tiles), "probe_s": round(time.perf_counter() - t0, 4),
+                                                    "caches": self.cache_counters()})
+        self.request_relayout()
+        # 第二阶段对所有新照片都跑一遍：视口内的直接显示，视口外的只预热磁盘缓存
+        if prefetch:
+            for tile in new_tiles: self.request_preview(tile.image_path)
 
     def clear_all(self):
-        for w in self.tile_widgets: w.destroy()
-        self.image_paths, self.img_ratios, self.preview_cache, self.tile_widgets = [], [], {}, []
-        self.logo_label.place_forget(); self.canvas_bg_frame.place_forget(); self.toggle_placeholder()
+        self.scan_gen += 1
+        self.project_path = None
+        self.root.title("AoiStitcher Universal")
+        for t in self.tiles: t.destroy()
+        self.image_paths, self.img_ratios, self.preview_cache, self.tiles = [], [], {}, []
+        self.preview_store.clear()
+        self.tile_by_item, self.selected_tile, self.drag_tile = {}, None, None
+        self.live_tiles, self.slot_tops, self.slot_order = set(), [], None
+        self.last_layout_sig = None
+        self.toggle_placeholder()
 
     def export_action(self):
+        # 导出进行中再点一次按钮 = 取消
+        if self.export_cancel is not None:
+            self.export_cancel.set()
+            self.exp_btn.config(text="正在取消…")
+            return
         if not self.image_paths: return
         self.save_settings()
         try:
-            tw, sp, bh = int(self.width_entry.get()), int(self.spacing_entry.get()), int(self.bottom_entry.get())
-            bg_rgb = self.bg_map[self.bg_var.get()]["rgb"]
-            imgs, th = [], 0
-            for p in self.image_paths:
-                img = Image.open(p); nh = int(img.size[1] * (tw / img.size[0]))
-                imgs.append(img.resize((tw, nh), Image.Resampling.LANCZOS)); th += nh
-            canvas = Image.new("RGB", (tw, th + (len(imgs)-1)*sp + bh), bg_rgb)
-            y = 0
-            for img in imgs: canvas.paste(img, (0, y)); y += img.size[1] + sp
-            
-            if self.config["logo_path"] and os.path.exists(self.config["logo_path"]):
-                logo = Image.open(self.config["logo_path"]).convert("RGBA")
-                lw = int(tw * (self.config["logo_scale"] / 100)); lh = int(logo.size[1]*(lw/logo.size[0]))
-                l_res = logo.resize((lw, lh), Image.Resampling.LANCZOS)
-                
-                final_x = (tw - lw) // 2 + self.config["logo_offset_x"]
-                final_y = y - sp + (bh - lh) // 2 + self.config["logo_offset_y"]
-                canvas.paste(l_res, (final_x, final_y), l_res)
-            
-            save_p = filedialog.asksaveasfilename(initialdir=self.config.get("last_export_dir"), 
-                                                   defaultextension=".jpg", 
-                                                   filetypes=[("JPEG Image", "*.jpg")])
-            if save_p:
-                self.config["last_export_dir"] = os.path.dirname(save_p)
-                canvas.save(save_p, quality=95, dpi=(300, 300))
-                self.save_settings()
-                messagebox.showinfo("成功", "成品已保存")
-        except Exception as e: messagebox.showerror("错误", str(e))
+            settings = self.strip_settings()
+        except Exception as e:
+            messagebox.showerror("错误", str(e)); return
+        
+        # 先选路径再渲染，用户取消对话框时不浪费任何计算
+        save_p = filedialog.asksaveasfilename(initialdir=self.config.get("last_export_dir"), 
+                                               defaultextension=".jpg", 
+                                               filetypes=[("JPEG Image", "*.jpg")])
+        if not save_p: return
+        self.config["last_export_dir"] = os.path.dirname(save_p)
+        self.save_settings()
+        
+        # 参数在主线程里取快照，导出期间继续编辑画布也不会影响这次成品
+        job = dict(paths=list(self.image_paths), out_path=save_p, **settings,
+                   extras=list(self.config["extra_outputs"]), resize_cache=self.resize_cache,
+                   stats=ExportStats() if self.profile_log else None)
+        self.export_stats = job["stats"]
+        self.export_cancel = threading.Event()
+        self.on_export_progress(0, len(job["paths"]))
+        threading.Thread(target=self.run_export_job, args=(job, self.export_cancel), daemon=True).start()
+
+    def strip_settings(self):
+        # 导出参数的快照（主线程里取），手动导出和监视模式共用
+        return dict(tw=int(self.width_entry.get()), sp=int(self.spacing_entry.get()), bh=int(self.bottom_entry.get()),
+                    bg_rgb=self.bg_map[self.bg_var.get()]["rgb"],
+                    logo_path=self.config["logo_path"], logo_scale=self.config["logo_scale"],
+                    logo_offset_x=self.config["logo_offset_x"], logo_offset_y=self.config["logo_offset_y"],
+                    workers=self.config["export_workers"], pool=self.config["export_pool"],
+                    logo_cache=self.logo_cache, max_height=int(self.config["split_max_height"]),
+                    max_bytes=int(float(self.config["split_max_mb"]) * 1024 * 1024),
+                    proof=self.config["export_tier"] == "proof", backend=self.config["compose_backend"])
+
+    def run_export_job(self, job, cancel):
+        # 运行在后台线程：这里只能通过 self.post 把结果交回主线程
+        try:
+            outputs = export_strip(**job, cancel=cancel, progress=lambda d, t: self.post(self.on_export_progress, d, t))
+            self.post(self.on_export_done, outputs, None)
+        except Exception as e:
+            self.post(self.on_export_done, [], e)
+
+    def on_export_progress(self, done, total):
+        if self.export_cancel is None or self.export_cancel.is_set(): return
+        self.exp_btn.config(text=f"导出中 {done}/{total} · 点击取消")
+
+    def on_export_done(self, outputs, error):
+        self.export_cancel = None
+        self.exp_btn.config(text="导出成品")
+        stats, self.export_stats = self.export_stats, None
+        if stats is not None: stats.stop()  # 参数检查就出错时引擎来不及停内存采样
+        if stats is not None and error is None: self.log_export_stats(stats)
+        if error is None:
+            msg = "成品已保存" if len(outputs) == 1 else f"已保存 {len(outputs)} 个文件"
+            messagebox.showinfo("成功", msg)
+        elif not isinstance(error, ExportCancelled): messagebox.showerror("错误", str(error))
+
+    def cache_counters(self):
+        photo = {"hits": self.photo_hits, "misses": self.photo_misses}
+        total = self.photo_hits + self.photo_misses
+        photo["hit_rate"] = round(self.photo_hits / total, 3) if total else None
+        return {"preview_cache": photo, "preview_store": hit_rate(self.preview_store),
+                "thumb_cache": hit_rate(self.thumb_cache), "logo_cache": hit_rate(self.logo_cache)}
+
+    def log_export_stats(self, stats):
+        record = stats.summary()
+        record["caches"].update(self.cache_counters())
+        log_record(self.profile_log, "export", record)
+        rates = [f"{k} {v['hit_rate']:.0%}" for k, v in record["caches"].items() if v["hit_rate"] is not None]
+        self.status_label.config(text=stats.status_line() + ("\n命中率 " + " · ".join(rates) if rates else ""))
+
+    # --- 项目文件 ---
+    # 照片顺序、比例和排版参数存成 .aoiproj；打开时不读照片，直接按存下的比例排版
+
+    def save_project_action(self):
+        if not self.image_paths: return
+        path = self.project_path or filedialog.asksaveasfilename(
+            initialdir=self.config.get("last_export_dir"), defaultextension=PROJECT_EXT,
+            filetypes=[("AoiStitcher Project", f"*{PROJECT_EXT}")])
+        if not path: return
+        self.save_settings()
+        try:
+            save_project(path, self.image_paths, self.img_ratios, self.config)
+            self.project_path = path
+            self.root.title(f"AoiStitcher · {os.path.basename(path)}")
+        except Exception as e:
+            messagebox.showerror("错误", str(e))
+
+    def open_project_action(self):
+        path = filedialog.askopenfilename(initialdir=self.config.get("last_export_dir"),
+                                          filetypes=[("AoiStitcher Project", f"*{PROJECT_EXT}")])
+        if path: self.open_project(path)
+
+    def open_project(self, path):
+        try:
+            photos, settings = load_project(path)
+        except Exception as e:
+            messagebox.showerror("错误", f"无法打开项目: {e}"); return
+        self.clear_all()
+        self.config.update(settings)
+        for entry, key in ((self.width_entry, "width"), (self.spacing_entry, "spacing"), (self.bottom_entry, "bottom_h")):
+            entry.delete(0, "end"); entry.insert(0, self.config[key])
+        self.bg_var.set(self.config["bg_theme"]); self.tier_var.set(self.config["export_tier"])
+        self.save_settings()
+        self.init_load_images([ph["path"] for ph in photos], ratios=[ph["ratio"] for ph in photos], prefetch=False)
+        self.project_path = path
+        self.root.title(f"AoiStitcher · {os.path.basename(path)}")
+        # 指纹核对放到后台，照片被改过或挪走的再回来修正
+        gen = self.scan_gen
+        threading.Thread(target=lambda: self.post(self.on_project_verified, gen, verify_photos(photos)), daemon=True).start()
+
+    def on_project_verified(self, gen, changed):
+        if gen != self.scan_gen or not changed: return
+        missing = 0
+        for i in range(len(self.image_paths) - 1, -1, -1):
+            p = self.image_paths[i]
+            if p not in changed: continue
+            self.preview_store.discard(p); self.preview_cache.pop(p, None)
+            if changed[p] is None:
+                self.delete_specific(i); missing += 1
+            else:
+                self.img_ratios[i] = changed[p]
+        self.request_relayout(force=True)
+        if missing: messagebox.showwarning("提示", f"有 {missing} 张照片找不到了，已从画布移除")
+
+    # --- 监视模式 ---
+    # 轮询文件夹，新照片写完后追加到画布末尾，再增量导出（只重新合成最后一卷）。
+    # 画布被手动改动（删除、拖动排序、改参数）后，下一次自动从头完整导出。
+
+    def toggle_watch(self):
+        if self.watch is not None:
+            watch, self.watch = self.watch, None
+            # 导出还在跑的话等它结束（on_watch_exported）再清理
+            if not watch["busy"] and watch["strip"] is not None: watch["strip"].close()
+            self.watch_btn.config(text="监视文件夹"); return
+        self.save_settings()
+        try: self.strip_settings()
+        except Exception as e:
+            messagebox.showerror("错误", str(e)); return
+        folder = filedialog.askdirectory(initialdir=self.config.get("last_img_dir"))
+        if not folder: return
+        out = filedialog.asksaveasfilename(initialdir=self.config.get("last_export_dir"), defaultextension=".jpg",
+                                           filetypes=[("JPEG Image", "*.jpg")])
+        if not out: return
+        self.config["last_img_dir"], self.config["last_export_dir"] = folder, os.path.dirname(out)
+        self.save_settings()
+        watcher = FolderWatcher(folder, order=self.config["import_order"], settle=self.config["watch_interval"])
+        watcher.mark_known(self.image_paths)  # 已经在画布上的不再重复导入
+        self.watch = dict(watcher=watcher, out_path=out, strip=None, settings=None, busy=False, again=False)
+        self.watch_btn.config(text="监视中 · 点击停止")
+        self.watch_export()  # 画布上已有的照片先导出一次
+        self.schedule_watch_poll(self.watch)
+
+    def schedule_watch_poll(self, watch):
+        self.root.after(int(self.config["watch_interval"] * 1000),
+                        lambda: threading.Thread(target=self.run_watch_poll, args=(watch,), daemon=True).start())
+
+    def run_watch_poll(self, watch):
+        # 后台线程：列目录、读新照片的文件头
+        if watch is not self.watch: return
+        found = watch["watcher"].poll()
+        sizes = [self.probe_or_none(p) for p in found]
+        self.post(self.on_watch_poll, watch, found, sizes)
+
+    def on_watch_poll(self, watch, found, sizes):
+        if watch is not self.watch: return
+        if found:
+            self.init_load_images(found, sizes)
+            self.watch_export()
+        self.schedule_watch_poll(watch)
+
+    def watch_export(self):
+        watch = self.watch
+        if watch is None or not self.image_paths: return
+        if watch["busy"]:
+            watch["again"] = True; return
+        try: settings = self.strip_settings()
+        except Exception: return
+        strip = watch["strip"]
+        # 只有“画布 = 已导出的照片 + 末尾新增”且参数没变时才能增量
+        if strip is None or settings != watch["settings"] or self.image_paths[:len(strip.paths)] != strip.paths:
+            if strip is not None: strip.close()
+            strip = IncrementalStrip(watch["out_path"], resize_cache=self.resize_cache, **settings)
+            watch["strip"], watch["settings"] = strip, settings
+        new = self.image_paths[len(strip.paths):]
+        if not new: return
+        watch["busy"] = True
+        threading.Thread(target=self.run_watch_export, args=(watch, strip, new), daemon=True).start()
+
+    def run_watch_export(self, watch, strip, new):
+        try:
+            strip.add(new)
+            self.post(self.on_watch_exported, watch, None)
+        except Exception as e:
+            self.post(self.on_watch_exported, watch, e)
+
+    def on_watch_exported(self, watch, error):
+        watch["busy"] = False
+        if watch is not self.watch:
+            watch["strip"].close(); return
+        if error is not None:
+            print(f"Watch export error: {error}")
+            self.watch_btn.config(text="监视中 · 导出出错，点击停止")
+        else:
+            self.watch_btn.config(text=f"监视中 · 已导出 {len(watch['strip'].paths)} 张")
+        if watch["again"]:
+            watch["again"] = False; self.watch_export()
 
 if __name__ == "__main__":
+    # 进程池在打包后的 exe 里需要这一句，否则子进程会重新拉起整个界面
+    multiprocessing.freeze_support()
+    
     # --- 启动修复 ---
     # 在某些 Intel Mac 或打包后的环境下，需要手动定位 dnd 库
     root = TkinterDnD.Tk()
@@ -560,3 +1088,5 @@ if __name__ == "__main__":
 
     app = AoiStitcher(root)
     root.mainloop()
+    # 窗口关掉后不再等排队中的缩略图
+    app.thumb_pool.shutdown(wait=False, cancel_futures=True)
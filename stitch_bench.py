@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+from PIL import Image, ImageDraw
+from stitch_engine import (export_strip, strip_height, preview_slots, nearest_slot, reorder,
+                           BG_THEMES)
+from image_cache import ThumbnailCache, PreviewStore, ResizeCache
+from stitch_profile import ExportStats, peak_rss_mb, hit_rate
+
+# --- AoiStitcher 基准测试 ---
+# 用合成照片集测导入、重排、拖动排序、导出的耗时和导出峰值内存，结果写成 JSON，方便前后对比。
+# 不加载 tkinter：重排 / 拖动走界面同一套排版函数（preview_slots / nearest_slot / reorder）
+# 和预览金字塔，只是不创建 PhotoImage。
+#   python stitch_bench.py -o before.json
+#   python stitch_bench.py --preset large -o after.json
+#   python stitch_bench.py --compare before.json after.json
+
+PRESETS = {
+    # (张数, 长边像素, 格式)
+    "quick": [(20, 1600, "jpg"), (20, 1600, "png")],
+    "standard": [(50, 3000, "jpg"), (50, 3000, "png"), (30, 3000, "tiff"), (200, 1600, "jpg")],
+    "large": [(100, 6000, "jpg"), (500, 2400, "jpg"), (60, 6000, "tiff")],
+}
+ASPECTS = [(3, 2), (2, 3), (4, 3), (3, 4), (1, 1), (16, 9), (9, 16)]
+STAGE = (1200, 900)  # 模拟的预览区大小
+
+
+def make_photo_set(folder, count, long_side, fmt, seed=0):
+    # 渐变底 + 随机色块 + 噪点，JPEG 压缩率接近真实照片；横竖图混排
+    os.makedirs(folder, exist_ok=True)
+    rnd = random.Random(seed)
+    noise = Image.effect_noise((256, 256), 40).convert("RGB")
+    paths = []
+    for i in range(count):
+        a, b = rnd.choice(ASPECTS)
+        w, h = (long_side, long_side * b // a) if a >= b else (long_side * a // b, long_side)
+        img = Image.linear_gradient("L").resize((w, h)).convert("RGB")
+        draw = ImageDraw.Draw(img)
+        for _ in range(12):
+            x, y = rnd.randrange(w), rnd.randrange(h)
+            r = rnd.randrange(long_side // 20, long_side // 4)
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=tuple(rnd.randrange(256) for _ in range(3)))
+        img = Image.blend(img, noise.resize((w, h)), 0.25)
+        p = os.path.join(folder, f"img_{i:04d}.{fmt}")
+        if fmt == "jpg": img.save(p, quality=92)
+        elif fmt == "tiff": img.save(p, compression="tiff_lzw")
+        else: img.save(p, compress_level=1)  # 只影响生成速度，解码开销一样
+        paths.append(p)
+    return paths
+
+
+def summarize(samples_ms):
+    s = sorted(samples_ms)
+    return {"mean_ms": round(statistics.fmean(s), 3), "p95_ms": round(s[min(len(s) - 1, int(len(s) * 0.95))], 3),
+            "max_ms": round(s[-1], 3), "events": len(s)}
+
+
+def bench_import(paths, cache_dir):
+    # 与 init_load_images 相同的两个阶段：读文件头拿比例，后台线程池出缩略图
+    thumb_cache = ThumbnailCache(cache_dir, 4096)
+    out = {}
+    for label in ("cold", "warm"):
+        t0 = time.perf_counter()
+        ratios = []
+        for p in paths:
+            w, h = thumb_cache.probe_size(p); ratios.append(h / w)
+        t1 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1)) as pool:
+            for thumb in pool.map(lambda p: thumb_cache.load(p, 1600), paths): thumb.close()  # 界面也不留全部缩略图
+        t2 = time.perf_counter()
+        out[label] = {"probe_s": round(t1 - t0, 4), "thumbs_s": round(t2 - t1, 4), "total_s": round(t2 - t0, 4)}
+    return out, ratios, thumb_cache
+
+
+def bench_relayout(paths, ratios, thumb_cache, tw=2000, sp=20, bh=250):
+    # 每个事件：重新排版 + 给可见范围（上下各多一屏）里的照片从金字塔取图并缩放到显示尺寸，
+    # 对应 realign_all + update_viewport 里除 PhotoImage 之外的部分。
+    # 金字塔里被淘汰的和界面一样从磁盘缓存重读（界面是后台线程，这里同步读，耗时算在事件里）
+    store = PreviewStore(256)
+    for p in paths: store.put(p, thumb_cache.load(p, 1600))  # 超出预算的先放进来的被淘汰
+    sw, sh = STAGE[0] - 60, STAGE[1] - 40
+    total_h = strip_height(ratios, tw, sp, bh)
+    fit = min(sw / tw, sh / total_h)
+    max_zoom = max((sw / tw) / fit, 1.0)
+    samples, reloads = [], 0
+    zooms = [1.0, min(2.0, max_zoom), max_zoom]
+    for event in range(60):
+        zoom = zooms[event % len(zooms)]
+        t0 = time.perf_counter()
+        scale = fit * zoom
+        p_tw, p_sp = int(tw * scale), int(sp * scale)
+        top = max((STAGE[1] - int(total_h * scale)) // 2, 20)
+        slots = preview_slots(ratios, p_tw, p_sp, top)
+        lo, hi = -STAGE[1], 2 * STAGE[1]
+        for p, (y, ph) in zip(paths, slots):
+            if y + ph >= lo and y <= hi and p_tw > 4 and ph > 4:
+                src = store.get(p, p_tw - 4)
+                if src is None:
+                    store.put(p, thumb_cache.load(p, 1600)); reloads += 1
+                    src = store.get(p, p_tw - 4)
+                src.resize((p_tw - 4, ph - 4), Image.Resampling.BICUBIC)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return dict(summarize(samples), reloads=reloads, store_hit_rate=hit_rate(store)["hit_rate"])
+
+
+def bench_drag(ratios, tw=2000, sp=20, bh=250):
+    # 把第一张从顶拖到底，每 2px 一个鼠标事件：找最近槽位，槽位变了就算新顺序
+    sw, sh = STAGE[0] - 60, STAGE[1] - 40
+    total_h = strip_height(ratios, tw, sp, bh)
+    scale = min(sw / tw, sh / total_h)
+    slots = preview_slots(ratios, int(tw * scale), int(sp * scale), 20)
+    centers = [y + h / 2 for y, h in slots]
+    ys = [y for y, _ in slots]  # 每张当前的 y，对应界面里 PreviewTile.move_to 的位置
+    potential, samples = 0, []
+    for cy in range(int(centers[0]), int(centers[-1]) + 1, 2):
+        t0 = time.perf_counter()
+        idx = nearest_slot(centers, cy)
+        if idx != potential:
+            potential = idx
+            # 和界面一样：只挪槽位真正变了的那几张
+            for pos, i in enumerate(reorder(len(ratios), 0, idx)):
+                if i != 0 and ys[i] != slots[pos][0]: ys[i] = slots[pos][0]
+        samples.append((time.perf_counter() - t0) * 1000)
+    return summarize(samples)
+
+
+def _export_once(paths, out_path, opts):
+    # 在独立子进程里跑，峰值内存只算这一次导出
+    cache_dir = opts.pop("resize_cache_dir", None)
+    cache = ResizeCache(cache_dir, 4096) if cache_dir else None
+    # Linux 上 ru_maxrss 跨 exec 保留，子进程会带上基准测试主进程的峰值；
+    # 只借用 ExportStats 的内存采样（不传给导出，不开分阶段计时），采不到时才退回进程峰值
+    sampler = ExportStats()
+    t0 = time.perf_counter()
+    outputs = export_strip(paths, out_path, resize_cache=cache, **opts)
+    elapsed = time.perf_counter() - t0
+    sampler.stop()
+    peak = sampler.peak_rss if sampler.peak_rss is not None else peak_rss_mb()
+    return {"wall_s": round(elapsed, 4), "peak_rss_mb": peak,
+            "bytes": sum(os.path.getsize(p) for p in outputs), "parts": len(outputs)}
+
+
+def bench_export(paths, work_dir, workers, backend):
+    base = dict(tw=2000, sp=20, bh=250, bg_rgb=BG_THEMES["White"], workers=workers, backend=backend)
+    variants = {
+        "full": dict(base),
+        "proof": dict(base, proof=True),
+        "resize_cache_cold": dict(base, resize_cache_dir=os.path.join(work_dir, "rc")),
+        "resize_cache_warm": dict(base, resize_cache_dir=os.path.join(work_dir, "rc")),
+    }
+    out = {}
+    ctx = multiprocessing.get_context("spawn")
+    for name, opts in variants.items():
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as ex:
+            out[name] = ex.submit(_export_once, paths, os.path.join(work_dir, f"{name}.jpg"), opts).result()
+    return out
+
+
+def run(preset, workers, backend, keep=None):
+    work = keep or tempfile.mkdtemp(prefix="aoi_bench_")
+    results = {
+        "meta": {"preset": preset, "python": platform.python_version(), "platform": platform.platform(),
+                 "cpus": os.cpu_count(), "workers": workers, "backend": backend,
+                 "pillow": Image.__version__, "time": time.strftime("%Y-%m-%d %H:%M:%S")},
+        "cases": {},
+    }
+    try:
+        for seed, (count, long_side, fmt) in enumerate(PRESETS[preset]):
+            name = f"{count}x{long_side}_{fmt}"
+            print(f"[{name}] 生成照片...", file=sys.stderr, flush=True)
+            t0 = time.perf_counter()
+            paths = make_photo_set(os.path.join(work, name, "src"), count, long_side, fmt, seed)
+            print(f"[{name}] 生成耗时 {time.perf_counter() - t0:.1f}s，开始测试", file=sys.stderr, flush=True)
+            imp, ratios, thumb_cache = bench_import(paths, os.path.join(work, name, "thumbs"))
+            case = {
+                "count": count, "long_side": long_side, "format": fmt,
+                "source_mb": round(sum(os.path.getsize(p) for p in paths) / 1048576, 1),
+                "import": imp,
+                "relayout": bench_relayout(paths, ratios, thumb_cache),
+                "drag": bench_drag(ratios),
+                "export": bench_export(paths, os.path.join(work, name), workers, backend),
+            }
+            results["cases"][name] = case
+            print(json.dumps({name: case["export"]["full"]}, ensure_ascii=False), file=sys.stderr)
+    finally:
+        if keep is None: shutil.rmtree(work, ignore_errors=True)
+    return results
+
+
+def flatten_metrics(node, prefix=""):
+    # {"a": {"b": 1}} -> {"a.b": 1}，只保留数值
+    out = {}
+    for k, v in node.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict): out.update(flatten_metrics(v, key + "."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool): out[key] = v
+    return out
+
+
+def compare(old_path, new_path):
+    with open(old_path, encoding="utf-8") as f: old = flatten_metrics(json.load(f)["cases"])
+    with open(new_path, encoding="utf-8") as f: new = flatten_metrics(json.load(f)["cases"])
+    for key in sorted(old.keys() & new.keys()):
+        a, b = old[key], new[key]
+        if not key.endswith(("_s", "_ms", "_mb")): continue
+        change = f"{(b - a) / a * 100:+.1f}%" if a else "n/a"
+        print(f"{key:60s} {a:>12} {b:>12} {change:>9}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="stitch_bench", description="AoiStitcher 基准测试")
+    ap.add_argument("-o", "--output", help="结果 JSON 路径，不给则打印到标准输出")
+    ap.add_argument("--preset", choices=sorted(PRESETS), default="quick", help="照片集规模")
+    ap.add_argument("--workers", type=int, default=0, help="导出解码线程数，0 = CPU 核数")
+    ap.add_argument("--backend", choices=["pil", "numpy"], default="pil", help="导出合成方式")
+    ap.add_argument("--keep", metavar="目录", help="把合成照片和导出结果留在这个目录")
+    ap.add_argument("--compare", nargs=2, metavar=("旧.json", "新.json"), help="对比两次结果")
+    args = ap.parse_args(argv)
+    if args.compare:
+        compare(*args.compare); return 0
+    results = run(args.preset, args.workers, args.backend, args.keep)
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f: f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
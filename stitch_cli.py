@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import time
+import argparse
+from stitch_engine import export_strip, parse_extra_output, BG_THEMES
+from stitch_ingest import scan_images
+from stitch_watch import FolderWatcher, IncrementalStrip
+from stitch_project import load_project, PROJECT_EXT
+from image_cache import ResizeCache
+from stitch_profile import ExportStats, profiling_enabled, profile_logger, log_record
+
+# --- AoiStitcher 命令行 / 批量拼图 ---
+# 不加载 tkinter / tkinterdnd2，可以在没有显示器的渲染机上跑。
+#   python stitch_cli.py 照片目录 -o 成品.jpg --width 2000 --logo logo.png
+#   python stitch_cli.py 目录A 目录B 目录C --batch -o 输出目录/
+#   python stitch_cli.py 照片目录 -o 成品.jpg --also 1080:webp:85 --also 2000:jpeg:85
+#   python stitch_cli.py 导出目录 -o 成品.jpg --watch      # 监视目录，新照片到了就增量导出
+#   python stitch_cli.py 婚礼.aoiproj -o 成品.jpg           # 按界面保存的项目（顺序 + 参数）导出
+
+# 与界面保存的 aoi_stitcher_config.json 使用同一套键名
+DEFAULTS = {
+    "width": "2000", "spacing": "20", "bottom_h": "250", "bg_theme": "White",
+    "logo_path": "", "logo_scale": 20, "logo_offset_x": 0, "logo_offset_y": 0,
+    "export_workers": 0, "export_pool": "thread", "compose_backend": "pil",
+    "split_max_height": 0, "split_max_mb": 0, "extra_outputs": [], "export_tier": "full", "profile": False,
+}
+
+
+def collect_images(inputs, recursive=False, order="name"):
+    # 文件按给定顺序，目录按文件名自然顺序展开（--recursive 时包括子目录）；文件头不是图片的跳过。
+    # 项目文件展开成它保存的照片顺序
+    paths, loose = [], []
+    def flush():
+        for batch in scan_images(loose, order=order, recursive=recursive,
+                                 on_skip=lambda p: print(f"跳过: {p}", file=sys.stderr)):
+            paths.extend(batch)
+        loose.clear()
+    for item in inputs:
+        if item.lower().endswith(PROJECT_EXT) and os.path.isfile(item):
+            flush()
+            for ph in load_project(item)[0]:
+                if os.path.isfile(ph["path"]): paths.append(ph["path"])
+                else: print(f"找不到: {ph['path']}", file=sys.stderr)
+        else:
+            loose.append(item)
+    flush()
+    return paths
+
+
+def build_parser():
+    ap = argparse.ArgumentParser(prog="stitch_cli", description="AoiStitcher 无界面拼图")
+    ap.add_argument("inputs", nargs="+", help="照片文件或目录")
+    ap.add_argument("-o", "--output", required=True, help="输出文件；--batch 时为输出目录")
+    ap.add_argument("--batch", action="store_true", help="每个输入目录单独拼成一张")
+    ap.add_argument("--config", help="读取界面保存的配置文件作为默认值")
+    ap.add_argument("--width", type=int, help="画布总宽 (px)")
+    ap.add_argument("--spacing", type=int, help="照片间距")
+    ap.add_argument("--bottom", type=int, help="留白高度")
+    ap.add_argument("--theme", choices=sorted(BG_THEMES), help="画布颜色")
+    ap.add_argument("--logo", help="水印文件；传空字符串表示不加水印")
+    ap.add_argument("--logo-scale", type=int, help="Logo 比例 (%%)")
+    ap.add_argument("--logo-offset-x", type=int, help="水平偏移")
+    ap.add_argument("--logo-offset-y", type=int, help="垂直偏移")
+    ap.add_argument("-r", "--recursive", action="store_true", help="目录连同子目录一起导入")
+    ap.add_argument("--order", choices=["name", "exif"], default="name", help="目录内排序：文件名自然顺序或拍摄时间")
+    ap.add_argument("--watch", action="store_true", help="监视输入目录，新照片写完后追加并增量导出（Ctrl+C 结束）")
+    ap.add_argument("--interval", type=float, default=2.0, help="监视模式的轮询间隔 (秒)")
+    ap.add_argument("--workers", type=int, help="解码线程/进程数，0 = CPU 核数")
+    ap.add_argument("--pool", choices=["thread", "process"], help="并行方式")
+    ap.add_argument("--backend", choices=["pil", "numpy"], help="合成方式，numpy 需要安装 numpy")
+    ap.add_argument("--max-height", type=int, help="分卷：每卷最大高度 (px)，0 = 不限")
+    ap.add_argument("--max-mb", type=float, help="分卷：每卷大约的最大体积 (MB)，0 = 不限")
+    ap.add_argument("--also", action="append", type=parse_extra_output, metavar="宽度[:格式[:质量]]",
+                    help="同时输出的附加版本，可重复，例如 --also 1080:webp:85")
+    ap.add_argument("--proof", action="store_const", const="proof", dest="tier",
+                    help="打样档：缩小解码 + 快速编码，排版与成品一致")
+    ap.add_argument("--resize-cache", metavar="目录", help="缓存缩放好的照片，重复导出同一批照片时跳过解码")
+    ap.add_argument("--resize-cache-mb", type=int, default=1024, help="缩放缓存容量 (MB)")
+    ap.add_argument("--profile", action="store_const", const=True, help="输出分阶段耗时（也可设环境变量 AOI_PROFILE=1）")
+    ap.add_argument("--profile-log", metavar="文件", help="把每次导出的耗时明细追加到滚动日志")
+    ap.add_argument("-q", "--quiet", action="store_true", help="不输出进度")
+    return ap
+
+
+def resolve_settings(args):
+    settings = dict(DEFAULTS)
+    if args.config:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            settings.update(json.load(f))
+    # 项目文件里存的排版参数优先于配置文件
+    for item in args.inputs:
+        if item.lower().endswith(PROJECT_EXT) and os.path.isfile(item):
+            settings.update(load_project(item)[1]); break
+    overrides = {
+        "width": args.width, "spacing": args.spacing, "bottom_h": args.bottom, "bg_theme": args.theme,
+        "logo_path": args.logo, "logo_scale": args.logo_scale,
+        "logo_offset_x": args.logo_offset_x, "logo_offset_y": args.logo_offset_y,
+        "export_workers": args.workers, "export_pool": args.pool, "compose_backend": args.backend,
+        "split_max_height": args.max_height, "split_max_mb": args.max_mb, "extra_outputs": args.also,
+        "export_tier": args.tier, "profile": args.profile,
+    }
+    settings.update({k: v for k, v in overrides.items() if v is not None})
+    return settings
+
+
+def stitch(paths, out_path, settings, quiet=False, resize_cache=None, log=None):
+    def progress(done, total):
+        if not quiet: print(f"\r  {done}/{total}", end="", file=sys.stderr, flush=True)
+    stats = ExportStats() if profiling_enabled(settings) or log else None
+    outputs = export_strip(paths, out_path, int(settings["width"]), int(settings["spacing"]), int(settings["bottom_h"]),
+                 BG_THEMES[settings["bg_theme"]],
+                 logo_path=settings["logo_path"], logo_scale=int(settings["logo_scale"]),
+                 logo_offset_x=int(settings["logo_offset_x"]), logo_offset_y=int(settings["logo_offset_y"]),
+                 workers=int(settings["export_workers"]), pool=settings["export_pool"], progress=progress,
+                 max_height=int(settings["split_max_height"]),
+                 max_bytes=int(float(settings["split_max_mb"]) * 1024 * 1024),
+                 extras=settings["extra_outputs"], proof=settings["export_tier"] == "proof",
+                 resize_cache=resize_cache, backend=settings["compose_backend"], stats=stats)
+    if not quiet:
+        for p in outputs: print(f"\r  → {p}", file=sys.stderr)
+    if stats is not None:
+        if not quiet: print(f"  {stats.status_line()}", file=sys.stderr)
+        if log: log_record(log, "export", stats.summary())
+
+
+def watch(folder, out_path, settings, args, resize_cache=None):
+    # 监视模式：总是分卷编号输出（名字_01.jpg ...），每次只重写最后一卷
+    if settings["extra_outputs"]: print("监视模式不生成附加版本，已忽略 --also", file=sys.stderr)
+    strip = IncrementalStrip(out_path, int(settings["width"]), int(settings["spacing"]), int(settings["bottom_h"]),
+                             BG_THEMES[settings["bg_theme"]], resize_cache=resize_cache,
+                             max_height=int(settings["split_max_height"]),
+                             max_bytes=int(float(settings["split_max_mb"]) * 1024 * 1024),
+                             logo_path=settings["logo_path"], logo_scale=int(settings["logo_scale"]),
+                             logo_offset_x=int(settings["logo_offset_x"]), logo_offset_y=int(settings["logo_offset_y"]),
+                             workers=int(settings["export_workers"]), pool=settings["export_pool"],
+                             proof=settings["export_tier"] == "proof", backend=settings["compose_backend"])
+    watcher = FolderWatcher(folder, order=args.order, recursive=args.recursive, settle=args.interval)
+    pending = collect_images([folder], args.recursive, args.order)  # 已经在目录里的先拼上
+    watcher.mark_known(pending)
+    pending = [os.path.abspath(p) for p in pending]
+    try:
+        while True:
+            if pending:
+                t0 = time.perf_counter()
+                try:
+                    outputs = strip.add(pending)
+                    pending = []
+                    if not args.quiet:
+                        names = ", ".join(os.path.basename(p) for p in outputs)
+                        print(f"已拼 {len(strip.paths)} 张，{time.perf_counter() - t0:.1f}s → {names}", file=sys.stderr)
+                except Exception as e:
+                    print(f"导出失败，下次重试: {e}", file=sys.stderr)
+            time.sleep(args.interval)
+            pending += watcher.poll()
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        strip.close()
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    settings = resolve_settings(args)
+    if settings["logo_path"] and not os.path.exists(settings["logo_path"]):
+        print(f"找不到水印文件: {settings['logo_path']}", file=sys.stderr); return 2
+
+    if args.watch:
+        if len(args.inputs) != 1 or not os.path.isdir(args.inputs[0]):
+            print("--watch 需要且只接受一个目录", file=sys.stderr); return 2
+        cache = ResizeCache(args.resize_cache, args.resize_cache_mb) if args.resize_cache else None
+        return watch(args.inputs[0], args.output, settings, args, cache)
+
+    if args.batch:
+        jobs = []
+        for item in args.inputs:
+            if not os.path.isdir(item):
+                print(f"--batch 只接受目录，跳过: {item}", file=sys.stderr); continue
+            name = os.path.basename(os.path.normpath(item)) + ".jpg"
+            jobs.append((collect_images([item], args.recursive, args.order), os.path.join(args.output, name)))
+        os.makedirs(args.output, exist_ok=True)
+    else:
+        jobs = [(collect_images(args.inputs, args.recursive, args.order), args.output)]
+
+    resize_cache = ResizeCache(args.resize_cache, args.resize_cache_mb) if args.resize_cache else None
+    log = profile_logger(args.profile_log) if args.profile_log else None
+    failed = 0
+    for paths, out_path in jobs:
+        if not paths:
+            print(f"没有可用的照片: {out_path}", file=sys.stderr); failed += 1; continue
+        try:
+            stitch(paths, out_path, settings, args.quiet, resize_cache, log)
+        except Exception as e:
+            print(f"\n导出失败 {out_path}: {e}", file=sys.stderr); failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,495 @@
+import io
+import functools
+import os
+import sys
+import mmap
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from PIL import Image
+
+# NumPy 可选：打包 exe 时排除了它，没有就退回 Pillow 合成。
+# 导入要近 0.1s，只在选了 numpy 合成时才导入（见 _numpy），默认路径的启动不受影响
+np = None
+
+# --- AoiStitcher 导出引擎 ---
+# 不依赖 tkinter。照片逐张“解码 → 缩放 → 粘贴 → 写入”，
+# 成品行数据写进以临时文件为后端的画布，编码器直接从映射里读取，
+# 峰值内存只和“画布宽 × 最高的一张照片”有关，与照片张数无关。
+
+
+# 导入时认可的扩展名，界面和命令行共用
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.psd', '.tiff', '.bmp')
+
+# JPEG 单边最多 65535px，留一点余量；WebP 上限 16383px。
+# PNG 格式本身不限，但保存时整卷要先转成内存里的 RGB 副本（见 StripCanvas.save），
+# 按 WebP 同样的行数分卷，内存上限才不随整条长度增长
+JPEG_MAX_SIDE = 65500
+MAX_SIDE = {"JPEG": JPEG_MAX_SIDE, "WEBP": 16383, "PNG": 16383}
+FORMAT_EXTS = {"JPEG": ".jpg", "WEBP": ".webp", "PNG": ".png"}
+PROOF_QUALITY = 85
+
+# 画布颜色主题
+BG_THEMES = {"White": (255, 255, 255), "Black": (0, 0, 0)}
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def probe_size(path):
+    # 只读文件头拿尺寸，不解码像素
+    with Image.open(path) as img:
+        return img.size
+
+
+def scaled_height(size, tw):
+    return int(size[1] * (tw / size[0]))
+
+
+def strip_height(ratios, tw, sp, bh):
+    # 成品总高：与导出时逐张 scaled_height 累加的结果一致
+    return sum(int(tw * r) for r in ratios) + (len(ratios) - 1) * sp + bh
+
+
+def preview_slots(ratios, p_tw, p_sp, top):
+    # 预览里每张照片的 (y, 高度)，界面重排和基准测试共用
+    slots, y = [], top
+    for r in ratios:
+        ph = int(p_tw * r)
+        slots.append((y, ph)); y += ph + p_sp
+    return slots
+
+
+def nearest_slot(centers, y):
+    # 拖动排序：离拖动中心最近的槽位
+    distances = [abs(y - c) for c in centers]
+    return distances.index(min(distances))
+
+
+def reorder(count, src, dst):
+    # 把第 src 张挪到 dst 之后的新顺序（原下标列表）
+    order = [i for i in range(count) if i != src]
+    order.insert(dst, src)
+    return order
+
+
+def load_resized(path, tw, proof=False, timings=None):
+    # timings 是 dict 时分别记下解码和缩放耗时（性能记录用）
+    with Image.open(path) as img:
+        size = (tw, scaled_height(img.size, tw))  # 目标尺寸以原图头信息为准，打样和成品排版一致
+        # 打样：JPEG 用 draft() 按 1/2~1/8 缩小解码到不小于目标的最小尺寸，
+        # 其他格式先整数倍 reduce()，最后一步用便宜的 BILINEAR
+        if proof: img.draft("RGB", size)
+        if timings is not None:
+            t0 = time.perf_counter(); img.load(); t1 = time.perf_counter()
+            timings["decode"] = t1 - t0
+        if proof: out = img.resize(size, Image.Resampling.BILINEAR, reducing_gap=1.0)
+        else: out = img.resize(size, Image.Resampling.LANCZOS)
+        if timings is not None: timings["resize"] = time.perf_counter() - t1
+        return out
+
+
+def load_thumbnail(path, max_side):
+    # JPEG 用 draft() 让 libjpeg 直接按 1/2、1/4、1/8 缩小解码，
+    # 其他格式由 thumbnail() 的 reducing_gap 先做整数倍 reduce() 再精细缩放
+    with Image.open(path) as img:
+        img.draft("RGB", (max_side, max_side))
+        img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        return img.convert("RGB")
+
+
+def _load_resized_via(cache, path, tw, proof):
+    # 进程池只能提交模块级函数
+    return cache.load(path, tw, proof)
+
+
+def _load_timed(cache, path, tw, proof):
+    # 性能记录打开时的加载函数：连同各阶段耗时一起返回，进程池里也能带回来
+    timings = {}
+    if cache is None: img = load_resized(path, tw, proof, timings)
+    else: img = cache.load(path, tw, proof, timings)
+    return img, timings
+
+
+def iter_resized(paths, tw, workers=1, pool="thread", proof=False, cache=None, timed=False):
+    # 解码 + LANCZOS 缩放分摊到线程/进程池，结果严格按 paths 顺序产出。
+    # 同时在途的任务数限制在 workers * 2，保证流式导出的内存上限不被预取撑破。
+    # cache 提供 load(path, tw, proof)（见 image_cache.ResizeCache），命中时直接读出已缩放好的像素；
+    # timed=True 时产出 (图, 耗时 dict)
+    if timed: load = functools.partial(_load_timed, cache)
+    else: load = load_resized if cache is None else functools.partial(_load_resized_via, cache)
+    workers = max(1, workers or os.cpu_count() or 1)
+    if workers == 1 or len(paths) == 1:
+        for p in paths: yield load(p, tw, proof)
+        return
+    executor_cls = ProcessPoolExecutor if pool == "process" else ThreadPoolExecutor
+    with executor_cls(max_workers=workers) as ex:
+        pending, it = deque(), iter(paths)
+        def submit_next():
+            p = next(it, None)
+            if p is not None: pending.append(ex.submit(load, p, tw, proof))
+        for _ in range(workers * 2): submit_next()
+        try:
+            while pending:
+                img = pending.popleft().result()
+                submit_next()
+                yield img
+        finally:
+            for f in pending: f.cancel()
+
+
+def load_logo(logo_path, tw, logo_scale, logo_cache=None):
+    # logo_cache 提供 resized(path, lw)，界面和导出共用一份已解码的水印
+    lw = max(int(tw * (logo_scale / 100)), 1)
+    if logo_cache is not None: return logo_cache.resized(logo_path, lw)
+    with Image.open(logo_path) as raw:
+        logo = raw.convert("RGBA")
+    lh = max(int(logo.size[1] * (lw / logo.size[0])), 1)
+    return logo.resize((lw, lh), Image.Resampling.LANCZOS)
+
+
+class OutputSpec:
+    # 一个导出目标：宽度、格式、质量和编码选项各自独立
+    def __init__(self, path, width, fmt="JPEG", quality=95, progressive=False, optimize=False):
+        self.path, self.width = path, int(width)
+        self.fmt = {"JPG": "JPEG"}.get(fmt.upper(), fmt.upper())
+        if self.fmt not in FORMAT_EXTS: raise ValueError(f"不支持的输出格式: {fmt}")
+        self.quality, self.progressive, self.optimize = int(quality), progressive, optimize
+
+    def save_params(self, proof=False):
+        # proof = 打样：质量封顶 85，关掉 optimize / progressive，编码器走最快档
+        params = dict(format=self.fmt, dpi=(300, 300))
+        if self.fmt == "JPEG":
+            params["quality"] = min(self.quality, PROOF_QUALITY) if proof else self.quality
+            if self.progressive and not proof: params["progressive"] = True
+            if self.optimize and not proof: params["optimize"] = True
+        elif self.fmt == "WEBP":
+            params["quality"] = min(self.quality, PROOF_QUALITY) if proof else self.quality
+            params["method"] = 0 if proof else (6 if self.optimize else 4)
+        elif proof:
+            params["compress_level"] = 1
+        elif self.optimize:
+            params["optimize"] = True
+        return params
+
+
+def extra_outputs(primary_path, extras):
+    # extras 来自配置 / 命令行：[{"width": 1080, "format": "WEBP", "quality": 85, "suffix": "_1080"}, ...]
+    # 输出文件放在主成品旁边：成品_1080.webp
+    base = os.path.splitext(primary_path)[0]
+    specs = []
+    for e in extras:
+        fmt = e.get("format", "JPEG")
+        spec = OutputSpec("", e["width"], fmt, e.get("quality", 95), e.get("progressive", False), e.get("optimize", False))
+        spec.path = base + e.get("suffix", f"_{spec.width}") + FORMAT_EXTS[spec.fmt]
+        specs.append(spec)
+    return specs
+
+
+def parse_extra_output(text):
+    # 命令行写法：宽度[:格式[:质量]]，例如 1080:webp:85
+    parts = text.split(":")
+    extra = {"width": int(parts[0])}
+    if len(parts) > 1 and parts[1]: extra["format"] = parts[1]
+    if len(parts) > 2 and parts[2]: extra["quality"] = int(parts[2])
+    return extra
+
+
+class StripCanvas:
+    # RGBX 排布（每像素 4 字节），Pillow 可以零拷贝地把映射包装成图像交给 JPEG 编码器
+    def __init__(self, width, height, tmp_dir=None):
+        self.width, self.height = width, height
+        self.stride = width * 4
+        self._file = tempfile.TemporaryFile(dir=tmp_dir)
+        self._file.truncate(self.stride * height)
+        self._map = mmap.mmap(self._file.fileno(), self.stride * height)
+
+    def write(self, y, img):
+        start = y * self.stride
+        data = img.tobytes("raw", "RGBX")
+        self._map[start:start + len(data)] = data
+
+    def fill(self, y, rows, rgb):
+        if rows <= 0: return
+        start = y * self.stride
+        self._map[start:start + rows * self.stride] = bytes((*rgb, 0)) * (self.width * rows)
+
+    def overlay(self, img, xy, rows):
+        # 带透明度的贴图（水印），只读回并改写与它相交的那几行
+        y0, y1 = max(xy[1], 0), min(xy[1] + img.size[1], rows)
+        if y0 >= y1: return
+        start, end = y0 * self.stride, y1 * self.stride
+        with Image.frombuffer("RGBX", (self.width, y1 - y0), self._map[start:end], "raw", "RGBX", 0, 1) as raw:
+            band = raw.convert("RGB")
+        band.paste(img, (xy[0], xy[1] - y0), img)
+        self.write(y0, band)
+
+    def save(self, path, rows=None, **params):
+        rows = self.height if rows is None else rows
+        im = Image.frombuffer("RGBX", (self.width, rows), self._map, "raw", "RGBX", 0, 1)
+        try:
+            if params.get("format") == "JPEG":
+                im.save(path, **params)
+            else:
+                # 只有 JPEG 编码器能直接吃 RGBX，其他格式先转成 RGB
+                with im.convert("RGB") as rgb: rgb.save(path, **params)
+        finally:
+            im.close()  # 释放对映射的引用，否则 mmap 无法关闭
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+
+class NumpyStripCanvas(StripCanvas):
+    # 同样的 RGBX 映射文件，用 uint8 数组视图做合成：照片行按切片写入，
+    # 间距和留白是整块切片赋值，水印只在自身外框内做整数 alpha 混合。
+    # 混合公式与 Pillow 的 paste(mask=RGBA) 完全一致，输出逐像素相同。
+    def __init__(self, width, height, tmp_dir=None):
+        super().__init__(width, height, tmp_dir)
+        self.arr = np.frombuffer(self._map, dtype=np.uint8).reshape(height, width, 4)
+
+    def write(self, y, img):
+        self.arr[y:y + img.size[1], :, :3] = np.asarray(img)
+
+    def fill(self, y, rows, rgb):
+        if rows > 0: self.arr[y:y + rows, :, :3] = rgb
+
+    def overlay(self, img, xy, rows):
+        x, y = xy
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + img.size[0], self.width), min(y + img.size[1], rows)
+        if x0 >= x1 or y0 >= y1: return
+        src = np.asarray(img)[y0 - y:y1 - y, x0 - x:x1 - x].astype(np.uint32)
+        dst = self.arr[y0:y1, x0:x1, :3]
+        a = src[..., 3:4]
+        t = dst * (255 - a) + src[..., :3] * a + 128
+        dst[...] = ((t >> 8) + t) >> 8
+
+    def close(self):
+        del self.arr  # 先释放数组视图，mmap 才能关闭
+        super().close()
+
+
+def _numpy():
+    # 首次调用时导入 numpy；没装返回 None
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return None
+        np = numpy
+    return np
+
+
+def flatten(tile, bg_rgb=(0, 0, 0)):
+    # 和原来直接 paste 到 RGB 画布的效果一致（RGBA 不按透明度混合，整张覆盖，底色不起作用）
+    if tile.mode == "RGB": return tile
+    flat = Image.new("RGB", tile.size, bg_rgb)
+    flat.paste(tile, (0, 0))
+    return flat
+
+
+def _encoded_size(img, params):
+    buf = io.BytesIO()
+    img.save(buf, **params)
+    return buf.tell()
+
+
+class StripSink:
+    # 一个输出目标：照片按顺序 add() 进来，逐张写入当前分卷的画布。
+    # 分卷只在照片边界切开，写满（高度或估算体积）就立刻编码，不等整条拼完。
+    # 只有一卷时输出到 out_path；多卷时按 名字_01、名字_02 ... 编号。
+    # part_start 不为 None 时总是编号，并从这个序号开始（监视模式只重写最后几卷）。
+    def __init__(self, out_path, width, heights, sp, bh, bg_rgb, logo=None, logo_offset=(0, 0),
+                 max_height=0, max_bytes=0, save_params=None, tmp_dir=None, backend="pil", stats=None,
+                 part_start=None):
+        self.out_path, self.width, self.heights = out_path, width, heights
+        self.part_start = part_start
+        self.part_counts = []  # 每卷的照片张数
+        self.tail_cut = False  # 最后一刀只是因为末张要带上留白才切的
+        self.stats = stats
+        self.sp, self.bh, self.bg_rgb = sp, bh, bg_rgb
+        self.logo, self.logo_offset = logo, logo_offset
+        self.save_params = save_params or dict(format="JPEG", quality=95, dpi=(300, 300))
+        limit = MAX_SIDE.get(self.save_params.get("format"))
+        self.max_height = min(max_height or limit or sys.maxsize, limit or sys.maxsize)
+        self.max_bytes = max_bytes
+        self.tmp_dir = tmp_dir
+        self.canvas_cls = NumpyStripCanvas if backend == "numpy" and _numpy() is not None else StripCanvas
+        self.parts = []
+        self.canvas, self.rows, self.count, self.est_bytes, self.index = None, 0, 0, 0, 0
+        # 分卷只能切在照片之间，单张（最后一张连同留白）超过 JPEG 上限就无解，解码前先拦下
+        tallest = max(heights[:-1] + [heights[-1] + bh])
+        if limit and tallest > limit:
+            raise ValueError(f"单张照片高度 {tallest}px 超出 {self.save_params['format']} 上限 {limit}px，请减小画布宽度")
+
+    def add(self, tile):
+        nh = self.heights[self.index]
+        last = self.index == len(self.heights) - 1
+        tail = self.bh if last else 0
+        stats = self.stats
+        if self.max_bytes:
+            if stats: t0 = time.perf_counter()
+            est = _encoded_size(flatten(tile, self.bg_rgb), self.save_params)
+            if stats: stats.add("split_estimate", time.perf_counter() - t0)
+        else: est = 0
+        if self.count:
+            full = self.rows + self.sp + nh > self.max_height or (self.max_bytes and self.est_bytes + est > self.max_bytes)
+            if full or self.rows + self.sp + nh + tail > self.max_height:
+                # 只因留白放不下而切开时，后面再追加照片这一刀就不成立了（监视模式要知道）
+                self.tail_cut = not full
+                self._flush()
+        gap = self.sp if self.count else 0
+        if self.canvas is None:
+            need = nh + tail
+            remaining = sum(self.heights[self.index:]) + (len(self.heights) - self.index - 1) * self.sp + self.bh
+            self.canvas = self.canvas_cls(self.width, max(min(remaining, self.max_height), need), self.tmp_dir)
+        if stats: t0 = time.perf_counter()
+        self.canvas.fill(self.rows, gap, self.bg_rgb)
+        flat = flatten(tile, self.bg_rgb)
+        self.canvas.write(self.rows + gap, flat)
+        if flat is not tile: flat.close()
+        if stats: stats.add("paste", time.perf_counter() - t0)
+        self.rows += gap + nh
+        self.count += 1; self.est_bytes += est; self.index += 1
+
+    def close(self):
+        # 留白和水印只属于最后一卷；水印位置按最后一卷自己的坐标计算
+        if self.canvas is None: raise ValueError("没有可导出的照片")
+        self.canvas.fill(self.rows, self.bh, self.bg_rgb)
+        if self.logo is not None:
+            t0 = time.perf_counter()
+            lw, lh = self.logo.size
+            xy = ((self.width - lw) // 2 + self.logo_offset[0], self.rows + (self.bh - lh) // 2 + self.logo_offset[1])
+            self.canvas.overlay(self.logo, xy, self.rows + self.bh)
+            if self.stats: self.stats.add("logo", time.perf_counter() - t0)
+        self.rows += self.bh
+        self._flush()
+        base, ext = os.path.splitext(self.out_path)
+        start = self.part_start or 1
+        if len(self.parts) == 1 and self.part_start is None:
+            outputs, stale = [self.out_path], 1  # 没有编号，上次留下的 _01 起都算旧卷
+        else:
+            outputs = [f"{base}_{i:02d}{ext}" for i in range(start, start + len(self.parts))]
+            stale = start + len(self.parts)
+        for part, dst in zip(self.parts, outputs): os.replace(part, dst)
+        self.parts = []
+        self._remove_stale_parts(stale)
+        return outputs
+
+    def _remove_stale_parts(self, n):
+        # 上次导出到同一个名字时分的卷更多：从第 n 卷起连续删掉旧卷，
+        # 否则里面被删掉的照片和第二份留白水印会跟着成品一起交出去
+        base, ext = os.path.splitext(self.out_path)
+        while os.path.exists(f"{base}_{n:02d}{ext}"):
+            try: os.remove(f"{base}_{n:02d}{ext}")
+            except OSError: break
+            n += 1
+
+    def abort(self):
+        if self.canvas is not None: self.canvas.close(); self.canvas = None
+        for part in self.parts:
+            try: os.remove(part)
+            except OSError: pass
+        self.parts = []
+
+    def _flush(self):
+        # 先写到 .part 临时文件，全部成功后再改名，取消或出错都不会留下半截成品
+        part = f"{self.out_path}.{len(self.parts) + 1}.part"
+        self.parts.append(part)
+        self.part_counts.append(self.count)
+        try:
+            t0 = time.perf_counter()
+            self.canvas.save(part, rows=self.rows, **self.save_params)
+            if self.stats: self.stats.add("encode", time.perf_counter() - t0)
+        finally:
+            self.canvas.close()
+            self.canvas, self.rows, self.count, self.est_bytes = None, 0, 0, 0
+
+
+def export_strip(paths, out_path, tw, sp, bh, bg_rgb, logo_path="", logo_scale=20,
+                 logo_offset_x=0, logo_offset_y=0, workers=1, pool="thread", tmp_dir=None,
+                 progress=None, cancel=None, logo_cache=None, max_height=0, max_bytes=0, extras=(), proof=False,
+                 resize_cache=None, backend="pil", stats=None):
+    # progress(done, total) 每处理完一张回调一次；cancel 是 threading.Event，置位后尽快中止。
+    # max_height / max_bytes 为 0 表示不限（JPEG 仍会在 65500px 处自动分卷）。
+    # extras 是附加输出（见 extra_outputs），和主成品一起一次导出。
+    # proof=True 为打样档：缩小解码 + 便宜的缩放滤镜 + 快速编码，排版与成品完全一致。
+    # backend="numpy" 用数组切片合成（需要安装 numpy，否则退回 Pillow）。
+    # stats 是 stitch_profile.ExportStats 时记录分阶段耗时，None 时不计时。返回写出的文件列表。
+    specs = [OutputSpec(out_path, tw)] + extra_outputs(out_path, extras)
+    return export_outputs(paths, specs, sp, bh, bg_rgb, logo_path, logo_scale, logo_offset_x, logo_offset_y,
+                          workers=workers, pool=pool, tmp_dir=tmp_dir, progress=progress, cancel=cancel,
+                          logo_cache=logo_cache, max_height=max_height, max_bytes=max_bytes, proof=proof,
+                          resize_cache=resize_cache, backend=backend, stats=stats)
+
+
+def export_outputs(paths, specs, sp, bh, bg_rgb, logo_path="", logo_scale=20, logo_offset_x=0, logo_offset_y=0,
+                   workers=1, pool="thread", tmp_dir=None, progress=None, cancel=None, logo_cache=None,
+                   max_height=0, max_bytes=0, proof=False, resize_cache=None, backend="pil", stats=None,
+                   part_start=None, part_info=None):
+    # 一次解码出多份成品：每张原图只按最大的输出宽度解码缩放一次，
+    # 较小的输出从这份已缩放的结果再缩小。间距、留白和水印偏移按宽度等比换算。
+    # part_start 见 StripSink；part_info 是调用方给的 dict，导出成功后填入第一份输出
+    # 每卷的照片张数 counts，以及最后一刀是否只因留白而切 tail_cut。
+    if not paths: raise ValueError("没有可导出的照片")
+    if any(s.width <= 0 for s in specs) or sp < 0 or bh < 0: raise ValueError("宽度、间距和留白必须是非负整数")
+
+    master_w = max(s.width for s in specs)
+    master_heights = [scaled_height(probe_size(p), master_w) for p in paths]
+    logo_ok = bool(logo_path) and os.path.exists(logo_path)
+    sinks = []
+    try:
+        for spec in specs:
+            f = spec.width / master_w
+            if spec.width == master_w:
+                heights, s_sp, s_bh, offset = master_heights, sp, bh, (logo_offset_x, logo_offset_y)
+            else:
+                heights = [scaled_height((master_w, h), spec.width) for h in master_heights]
+                s_sp, s_bh, offset = round(sp * f), round(bh * f), (int(logo_offset_x * f), int(logo_offset_y * f))
+            logo = load_logo(logo_path, spec.width, logo_scale, logo_cache) if logo_ok else None
+            sinks.append(StripSink(spec.path, spec.width, heights, s_sp, s_bh, bg_rgb, logo, offset,
+                                   max_height, max_bytes, spec.save_params(proof), tmp_dir, backend, stats, part_start))
+
+        # 缓存只写放得进容量的前若干张，见 ResizeCache.plan
+        if resize_cache is not None: resize_cache.plan(paths, master_w, master_heights, proof)
+        downscale = Image.Resampling.BILINEAR if proof else Image.Resampling.LANCZOS
+        images = iter_resized(paths, master_w, workers, pool, proof, resize_cache, timed=stats is not None)
+        if stats: t_wait = time.perf_counter()
+        for i, resized in enumerate(images):
+            if stats:
+                # 导出线程等工作线程出图的时间；远大于合成 + 编码时说明瓶颈在解码
+                resized, timings = resized
+                timings["wait"] = time.perf_counter() - t_wait
+                stats.image(paths[i], timings)
+            if cancel is not None and cancel.is_set():
+                resized.close(); raise ExportCancelled()
+            with resized as tile:
+                for sink in sinks:
+                    if sink.width == master_w:
+                        sink.add(tile); continue
+                    if stats: t0 = time.perf_counter()
+                    flat = flatten(tile, bg_rgb)
+                    small = flat.resize((sink.width, sink.heights[i]), downscale)
+                    if flat is not tile: flat.close()
+                    if stats: stats.add("downscale", time.perf_counter() - t0)
+                    with small: sink.add(small)
+            if progress: progress(i + 1, len(paths))
+            if stats: t_wait = time.perf_counter()
+        if cancel is not None and cancel.is_set(): raise ExportCancelled()
+        outputs = []
+        for sink in sinks: outputs.extend(sink.close())
+        if part_info is not None: part_info.update(counts=sinks[0].part_counts, tail_cut=sinks[0].tail_cut)
+        if stats: stats.finish(outputs)
+        return outputs
+    except BaseException:
+        for sink in sinks: sink.abort()
+        if stats: stats.stop()
+        raise
@@ -0,0 +1,120 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from stitch_engine import IMAGE_EXTS
+
+# --- AoiStitcher 批量导入 ---
+# 拖进来或选中的文件夹递归扫描：os.scandir 列目录（大多数文件系统不需要额外 stat），
+# 文件头校验和取拍摄时间交给线程池并发做，NAS 上的延迟可以重叠起来。
+# 结果按批产出，界面拿到一批就先排上一批，不等整棵目录扫完。
+
+# 文件头魔数；扩展名对但内容不是图片的（半截拷贝、macOS 的 ._ 资源文件）在这里挡掉
+SIGNATURES = (
+    b"\xff\xd8\xff",               # JPEG
+    b"\x89PNG\r\n\x1a\n",          # PNG
+    b"II*\x00", b"MM\x00*",        # TIFF
+    b"BM",                         # BMP
+    b"8BPS",                       # PSD
+)
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 0x9003
+EXIF_DATETIME = 0x0132
+
+
+def natural_key(name):
+    # img2 排在 img10 前面；不区分大小写
+    return [int(t) if t.isdigit() else t.casefold() for t in re.split(r"(\d+)", name)]
+
+
+def has_image_signature(path):
+    try:
+        with open(path, "rb") as f:
+            head = f.read(8)
+    except OSError:
+        return False
+    return head.startswith(SIGNATURES)
+
+
+def capture_time(path):
+    # EXIF 拍摄时间（"YYYY:MM:DD HH:MM:SS"，可以直接按字符串比较）；没有就返回 None。
+    # getexif() 只读文件头，不解码像素
+    try:
+        with Image.open(path) as img:
+            exif = img.getexif()
+            return exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+    except Exception:
+        return None
+
+
+def _check(path, order):
+    # 线程池里跑：校验文件头，按需读拍摄时间
+    if not has_image_signature(path): return None
+    return path, capture_time(path) if order == "exif" else None
+
+
+def _sorted_entries(folder):
+    # 一个目录的 (子目录, 图片文件)，都按自然顺序；隐藏文件跳过
+    dirs, files = [], []
+    try:
+        with os.scandir(folder) as it:
+            for e in it:
+                if e.name.startswith("."): continue
+                try:
+                    if e.is_dir(): dirs.append(e.path)
+                    elif e.name.lower().endswith(IMAGE_EXTS) and e.is_file(): files.append(e.path)
+                except OSError: pass
+    except OSError as e:
+        print(f"Scan error: {e}")
+    dirs.sort(key=lambda p: natural_key(os.path.basename(p)))
+    files.sort(key=lambda p: natural_key(os.path.basename(p)))
+    return dirs, files
+
+
+def scan_images(inputs, order="name", recursive=True, workers=8, batch=64, on_skip=None):
+    # inputs 里的文件按给定顺序，文件夹（深度优先）逐个展开；每次产出一批已校验的路径。
+    # order="name" 按文件名自然排序，边校验边产出；
+    # order="exif" 同一文件夹内按拍摄时间排（没有拍摄时间的排在后面，再按文件名），
+    # 需要等这个文件夹校验完才能排序，所以按文件夹产出。
+    # on_skip(path) 在显式给出、却不是图片的输入上回调。
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def checked(paths):
+            # 分块提交，块内并发；结果与输入一一对应，不合格的是 None
+            for i in range(0, len(paths), batch):
+                part = paths[i:i + batch]
+                yield part, list(pool.map(lambda p: _check(p, order), part))
+
+        def check_loose(loose):
+            for part, results in checked(loose):
+                ok = []
+                for p, r in zip(part, results):
+                    if r: ok.append(p)
+                    elif on_skip: on_skip(p)
+                if ok: yield ok
+
+        def walk(folder):
+            stack = [folder]
+            while stack:
+                dirs, files = _sorted_entries(stack.pop())
+                if recursive: stack.extend(reversed(dirs))
+                if order == "exif":
+                    found = [r for _, results in checked(files) for r in results if r]
+                    found.sort(key=lambda r: (r[1] is None, r[1] or "", natural_key(os.path.basename(r[0]))))
+                    for i in range(0, len(found), batch):
+                        yield [p for p, _ in found[i:i + batch]]
+                else:
+                    for _, results in checked(files):
+                        ok = [p for p, _ in filter(None, results)]
+                        if ok: yield ok
+
+        # 保持输入顺序：相邻的散文件攒成一组，遇到文件夹先把前面的散文件交出去
+        loose = []
+        for item in inputs:
+            if os.path.isdir(item):
+                yield from check_loose(loose); loose = []
+                yield from walk(item)
+            elif item.lower().endswith(IMAGE_EXTS) and os.path.isfile(item):
+                loose.append(item)
+            elif on_skip:
+                on_skip(item)
+        yield from check_loose(loose)
@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import time
+import logging
+import logging.handlers
+import threading
+from collections import defaultdict
+
+# --- AoiStitcher 性能记录 ---
+# 默认关闭：导出引擎拿到 stats=None 时每个阶段只多一次 if 判断。
+# 打开方式：环境变量 AOI_PROFILE=1，或配置文件里 "profile": true。
+# 每次导出的分阶段耗时、峰值内存和各缓存命中率以 JSON 行写入滚动日志。
+
+PROFILE_ENV = "AOI_PROFILE"
+STAGES = ("decode", "resize", "cache_read", "wait", "paste", "downscale", "split_estimate", "logo", "encode")
+
+
+def profiling_enabled(config=None):
+    env = os.environ.get(PROFILE_ENV, "").strip().lower()
+    if env: return env not in ("0", "false", "no", "off")
+    return bool(config and config.get("profile"))
+
+
+if sys.platform == "win32":
+    import ctypes
+    from ctypes import wintypes
+
+    class _MemoryCounters(ctypes.Structure):
+        # PROCESS_MEMORY_COUNTERS
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    def _win_memory():
+        counters = _MemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        kernel32 = ctypes.windll.kernel32
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return None
+        return counters
+
+
+def peak_rss_mb():
+    # 进程自身从启动到现在的峰值常驻内存（Windows 上是 PeakWorkingSetSize）；拿不到时返回 None
+    if sys.platform == "win32":
+        counters = _win_memory()
+        return round(counters.PeakWorkingSetSize / 1048576, 1) if counters else None
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def rss_mb():
+    # 当前常驻内存；Windows 用 WorkingSetSize，Linux 读 /proc，其他平台返回 None
+    if sys.platform == "win32":
+        counters = _win_memory()
+        return round(counters.WorkingSetSize / 1048576, 1) if counters else None
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / 1048576, 1)
+
+
+def hit_rate(cache):
+    # 缓存对象上的 hits / misses 计数 → {"hits", "misses", "hit_rate"}
+    hits, misses = getattr(cache, "hits", 0), getattr(cache, "misses", 0)
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": round(hits / total, 3) if total else None}
+
+
+class ExportStats:
+    # 一次导出的计时汇总。解码 / 缩放在工作线程（或子进程）里计时，随结果带回来；
+    # 合成、水印、编码在导出线程里直接 add()。
+    # 峰值内存：进程峰值是整个会话的最大值，所以导出期间另起线程每 50ms 采一次当前常驻内存，
+    # 记下这次导出自己的峰值；平台拿不到当前值（macOS）时只能给会话峰值。
+    SAMPLE_INTERVAL = 0.05
+
+    def __init__(self):
+        self.stages = defaultdict(float)
+        self.images = []
+        self.resize_cache = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        self.wall = None
+        self.outputs = []
+        self.peak_rss = None  # 这次导出期间采样到的最高常驻内存 (MB)
+        self._done = threading.Event()
+        if rss_mb() is not None:
+            threading.Thread(target=self._sample_rss, daemon=True).start()
+
+    def _sample_rss(self):
+        while True:
+            rss = rss_mb()
+            if rss is not None and (self.peak_rss is None or rss > self.peak_rss): self.peak_rss = rss
+            if self._done.wait(self.SAMPLE_INTERVAL): return
+
+    def stop(self):
+        # 停止内存采样；finish() 会调用，导出出错或取消时由导出引擎调用
+        self._done.set()
+
+    def add(self, stage, seconds):
+        with self._lock: self.stages[stage] += seconds
+
+    def image(self, path, timings):
+        # timings 来自 load_resized / ResizeCache.load，"resize_cache" 标记命中与否
+        with self._lock:
+            for stage, sec in timings.items():
+                if stage in STAGES: self.stages[stage] += sec
+            hit = timings.get("resize_cache")
+            if hit is not None: self.resize_cache["hits" if hit else "misses"] += 1
+            self.images.append(dict(timings, path=path))
+
+    def finish(self, outputs):
+        self.stop()
+        self.wall = time.perf_counter() - self._t0
+        self.outputs = list(outputs)
+
+    def summary(self, **caches):
+        # caches: 名字 → 带 hits/misses 计数的缓存对象
+        rc = self.resize_cache
+        total = rc["hits"] + rc["misses"]
+        out = {
+            "wall_s": round(self.wall if self.wall is not None else time.perf_counter() - self._t0, 4),
+            "images": len(self.images),
+            "stages_s": {k: round(v, 4) for k, v in self.stages.items()},
+            "peak_rss_mb": self.peak_rss,                # 这次导出；采不到时为 None
+            "session_peak_rss_mb": peak_rss_mb(),        # 进程启动以来
+            "caches": {name: hit_rate(c) for name, c in caches.items() if c is not None},
+            "outputs": self.outputs,
+            "per_image": [{k: (round(v, 4) if isinstance(v, float) else v) for k, v in t.items()} for t in self.images],
+        }
+        if total: out["caches"]["resize_cache"] = dict(rc, hit_rate=round(rc["hits"] / total, 3))
+        return out
+
+    def status_line(self):
+        # 界面 / 命令行上的一行小结：总耗时 + 最慢的三个阶段
+        wall = self.wall if self.wall is not None else time.perf_counter() - self._t0
+        top = sorted(self.stages.items(), key=lambda kv: -kv[1])[:3]
+        parts = " · ".join(f"{k} {v:.1f}s" for k, v in top)
+        if self.peak_rss is not None: rss = f" · 峰值 {self.peak_rss:.0f}MB"
+        else:
+            session = peak_rss_mb()
+            rss = f" · 进程峰值 {session:.0f}MB" if session else ""
+        return f"导出 {wall:.1f}s（{parts}）" + rss
+
+
+def profile_logger(log_path, max_mb=2, backups=3):
+    # 滚动日志：每个文件最多 max_mb，保留 backups 份旧文件
+    logger = logging.getLogger("aoi_stitcher.profile")
+    if not logger.handlers:
+        os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=int(max_mb * 1024 * 1024),
+                                                       backupCount=backups, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+def log_record(logger, kind, record):
+    logger.info("%s %s", kind, json.dumps(record, ensure_ascii=False))
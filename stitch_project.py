@@ -0,0 +1,89 @@
+import os
+import json
+from stitch_engine import probe_size
+
+# --- AoiStitcher 项目文件 (.aoiproj) ---
+# 一个 JSON：照片顺序、每张的高宽比（img_ratios）和指纹（文件大小 + mtime），以及排版 / 水印参数。
+# 重新打开时直接用存下的比例排版，不打开任何照片；指纹在后台核对，变了的才重新读文件头。
+# 路径同时存绝对路径和相对项目文件的路径，整个活动文件夹挪位置后也能找到。
+
+PROJECT_EXT = ".aoiproj"
+PROJECT_VERSION = 1
+# 随项目保存的参数，键名与 aoi_stitcher_config.json 一致
+PROJECT_KEYS = ("width", "spacing", "bottom_h", "bg_theme",
+                "logo_path", "logo_scale", "logo_offset_x", "logo_offset_y",
+                "export_tier", "split_max_height", "split_max_mb", "extra_outputs")
+
+
+def fingerprint(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def _rel(path, base):
+    try:
+        return os.path.relpath(path, base)
+    except ValueError:
+        return None  # Windows 上不在同一个盘
+
+
+def save_project(project_path, paths, ratios, settings):
+    # ratios 与 paths 一一对应（高 / 宽）；读不到指纹的照片照样保存，打开时再处理
+    base = os.path.dirname(os.path.abspath(project_path))
+    photos = []
+    for p, ratio in zip(paths, ratios):
+        ap = os.path.abspath(p)
+        entry = {"path": ap, "rel": _rel(ap, base), "ratio": ratio}
+        try:
+            entry["bytes"], entry["mtime_ns"] = fingerprint(ap)
+        except OSError:
+            pass
+        photos.append(entry)
+    data = {"version": PROJECT_VERSION, "settings": {k: settings[k] for k in PROJECT_KEYS if k in settings},
+            "photos": photos}
+    logo = data["settings"].get("logo_path")
+    if logo: data["settings"]["logo_rel"] = _rel(os.path.abspath(logo), base)
+    tmp = project_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, project_path)
+
+
+def _resolve(entry_path, rel, base):
+    # 先找原来的绝对路径，找不到再按相对路径找
+    if os.path.exists(entry_path) or not rel: return entry_path
+    moved = os.path.normpath(os.path.join(base, rel))
+    return moved if os.path.exists(moved) else entry_path
+
+
+def load_project(project_path):
+    # 返回 (照片列表, 参数)。照片是 dict：path / ratio / fingerprint（可能为 None）。
+    # 只读项目文件本身，不碰照片
+    with open(project_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version", 0) > PROJECT_VERSION:
+        raise ValueError("项目文件来自更新版本的 AoiStitcher")
+    base = os.path.dirname(os.path.abspath(project_path))
+    photos = []
+    for e in data.get("photos", []):
+        fp = (e["bytes"], e["mtime_ns"]) if "bytes" in e else None
+        photos.append({"path": _resolve(e["path"], e.get("rel"), base), "ratio": e["ratio"], "fingerprint": fp})
+    settings = dict(data.get("settings", {}))
+    logo_rel = settings.pop("logo_rel", None)
+    if settings.get("logo_path"): settings["logo_path"] = _resolve(settings["logo_path"], logo_rel, base)
+    return photos, settings
+
+
+def verify_photos(photos):
+    # 核对指纹：返回 {path: 新的高宽比}，照片不见了为 None。没变的不出现在结果里。
+    # 只在指纹对不上时才读文件头；适合放在后台线程里跑
+    changed = {}
+    for ph in photos:
+        path = ph["path"]
+        try:
+            if fingerprint(path) == ph["fingerprint"]: continue
+            w, h = probe_size(path)
+            if h / w != ph["ratio"]: changed[path] = h / w
+        except Exception:
+            changed[path] = None
+    return changed
@@ -0,0 +1,107 @@
+import os
+import time
+import shutil
+import tempfile
+from stitch_engine import export_outputs, OutputSpec, IMAGE_EXTS
+from stitch_ingest import has_image_signature, natural_key, capture_time
+from image_cache import ResizeCache
+
+# --- AoiStitcher 监视模式 ---
+# 现场修图时 Lightroom 不断往导出目录里写照片：轮询目录，文件写完（大小和 mtime
+# 停止变化一段时间）后追加到拼图末尾，再增量导出。
+# 增量导出依赖分卷：前面已经写满的卷不再变化，只重新合成最后一卷（含留白和水印），
+# 所以每次的耗时取决于一卷有多大，而不是整条已经多长。
+
+WATCH_PART_HEIGHT = 20000  # 没有设置分卷高度时，监视模式按这个高度分卷
+
+
+class FolderWatcher:
+    # poll() 返回这次新“稳定”下来的照片：settle 秒内大小和 mtime 都没变，文件头是图片。
+    # 已经交出去的文件不会再交第二次（之后被改写也一样）。
+    def __init__(self, folder, order="name", recursive=False, settle=2.0):
+        self.folder, self.order, self.recursive, self.settle = folder, order, recursive, settle
+        self.known = set()
+        self._pending = {}  # path -> ((size, mtime_ns), 首次看到这个状态的时间)
+
+    def mark_known(self, paths):
+        self.known.update(os.path.abspath(p) for p in paths)
+
+    def _listing(self):
+        out, stack = {}, [self.folder]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as it:
+                    for e in it:
+                        if e.name.startswith("."): continue
+                        try:
+                            if e.is_dir():
+                                if self.recursive: stack.append(e.path)
+                            elif e.name.lower().endswith(IMAGE_EXTS):
+                                st = e.stat(); out[os.path.abspath(e.path)] = (st.st_size, st.st_mtime_ns)
+                        except OSError: pass
+            except OSError as e:
+                print(f"Watch error: {e}")
+        return out
+
+    def poll(self):
+        now = time.monotonic()
+        listing = self._listing()
+        ready = []
+        for path, sig in listing.items():
+            if path in self.known: continue
+            seen = self._pending.get(path)
+            if seen is None or seen[0] != sig:
+                self._pending[path] = (sig, now); continue
+            if sig[0] > 0 and now - seen[1] >= self.settle and has_image_signature(path):
+                ready.append(path)
+        # 被删掉或挪走的文件不再等
+        for path in [p for p in self._pending if p not in listing]: del self._pending[path]
+        for path in ready: del self._pending[path]
+        self.known.update(ready)
+        if self.order == "exif":
+            ready.sort(key=lambda p: (capture_time(p) or "~", natural_key(os.path.basename(p))))
+        else:
+            ready.sort(key=lambda p: natural_key(os.path.relpath(p, self.folder)))
+        return ready
+
+
+class IncrementalStrip:
+    # 只追加的拼图 + 分卷导出：sealed 卷已经写完不再动，tail 是最后一卷里的照片。
+    # add() 时只把 tail + 新照片重新导出，输出编号从 sealed + 1 开始。
+    # 分卷是从每卷开头贪心切的，只有最后一刀例外：末张带上留白放不下才切开的那一卷，
+    # 照片再多一张时本来放得下，所以这一卷也不封，下次连同最后一卷一起重导。
+    # 这样结果和整条一次导出完全一致。
+    # 缩放结果走 resize_cache，tail 里的旧照片只读缓存不重新解码。
+    def __init__(self, out_path, tw, sp, bh, bg_rgb, resize_cache=None, max_height=0, **export_kwargs):
+        self.out_path, self.tw, self.sp, self.bh, self.bg_rgb = out_path, tw, sp, bh, bg_rgb
+        self.max_height = max_height or WATCH_PART_HEIGHT
+        self.export_kwargs = export_kwargs
+        self._own_cache = resize_cache is None  # 自己建的临时缓存，close() 时删掉
+        if resize_cache is None:
+            resize_cache = ResizeCache(tempfile.mkdtemp(prefix="aoi_watch_"), 1024)
+        self.resize_cache = resize_cache
+        self.paths = []  # 已经导出的全部照片，按顺序
+        self.sealed = 0
+        self.tail = []
+
+    def add(self, new_paths, progress=None, cancel=None, stats=None):
+        # 返回这次重写的文件；出错时状态不变，下次连同新照片一起重试
+        if not new_paths: return []
+        paths = self.tail + list(new_paths)
+        info = {}
+        outputs = export_outputs(paths, [OutputSpec(self.out_path, self.tw)], self.sp, self.bh, self.bg_rgb,
+                                 max_height=self.max_height, resize_cache=self.resize_cache,
+                                 progress=progress, cancel=cancel, stats=stats,
+                                 part_start=self.sealed + 1, part_info=info, **self.export_kwargs)
+        self.paths.extend(new_paths)
+        counts = info["counts"]
+        keep = 2 if info["tail_cut"] else 1
+        self.sealed += len(outputs) - keep
+        self.tail = paths[len(paths) - sum(counts[-keep:]):]
+        return outputs
+
+    def close(self):
+        # 不再往这条拼图追加时调用；调用方传进来的缓存不动
+        if self._own_cache:
+            shutil.rmtree(self.resize_cache.cache_dir, ignore_errors=True)
+            self._own_cache = False